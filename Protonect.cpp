@@ -30,6 +30,11 @@
 #include <stdio.h>
 #include <signal.h>
 #include <math.h>
+#include <string.h>
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
 
 #include <opencv2/opencv.hpp>
 
@@ -46,6 +51,103 @@ void sigint_handler(int s)
   protonect_shutdown = true;
 }
 
+// shared memory ring read by the simulator (mapsource.py), see depthring.py
+// for the layout; the header is followed by slotCount slots of a frame
+// counter plus width * height mask bytes, padded to 8 bytes
+struct DepthRingHeader
+{
+  char magic[4];
+  uint16_t version;
+  uint16_t reserved;
+  uint32_t slotCount;
+  uint32_t width;
+  uint32_t height;
+  float threshold;
+  uint64_t latestFrame;
+};
+
+struct DepthRing
+{
+  int fd;
+  size_t size;
+  size_t slotSize;
+  unsigned char* data;
+  DepthRingHeader* header;
+};
+
+bool openDepthRing(DepthRing& ring, const std::string& path, int width, int height, float threshold)
+{
+  const uint32_t slotCount = 3;
+  ring.slotSize = sizeof(uint64_t) + (width * height + 7) / 8 * 8;
+  ring.size = sizeof(DepthRingHeader) + slotCount * ring.slotSize;
+
+  ring.fd = open(path.c_str(), O_RDWR | O_CREAT, 0644);
+  if (ring.fd < 0) {
+    perror("Error opening depth ring");
+    return false;
+  }
+
+  if (ftruncate(ring.fd, ring.size) != 0) {
+    perror("Error sizing depth ring");
+    close(ring.fd);
+    return false;
+  }
+
+  void* data = mmap(0, ring.size, PROT_READ | PROT_WRITE, MAP_SHARED, ring.fd, 0);
+  if (data == MAP_FAILED) {
+    perror("Error mapping depth ring");
+    close(ring.fd);
+    return false;
+  }
+
+  ring.data = (unsigned char*)data;
+  ring.header = (DepthRingHeader*)data;
+  memset(ring.data, 0, ring.size);
+  memcpy(ring.header->magic, "CSDR", 4);
+  ring.header->version = 1;
+  ring.header->slotCount = slotCount;
+  ring.header->width = width;
+  ring.header->height = height;
+  ring.header->threshold = threshold;
+  ring.header->latestFrame = 0;
+  __sync_synchronize();
+
+  return true;
+}
+
+void writeDepthRing(DepthRing& ring, const cv::Mat& mask, float threshold)
+{
+  const int width = ring.header->width;
+  const int height = ring.header->height;
+
+  cv::Mat frameMask = mask;
+  if (mask.cols != width || mask.rows != height) {
+    cv::resize(mask, frameMask, cv::Size(width, height), 0, 0, cv::INTER_NEAREST);
+  }
+
+  uint64_t frame = ring.header->latestFrame + 1;
+  unsigned char* slot = ring.data + sizeof(DepthRingHeader) + (frame % ring.header->slotCount) * ring.slotSize;
+  volatile uint64_t* slotFrame = (volatile uint64_t*)slot;
+
+  // the reader compares the slot counter before and after copying
+  *slotFrame = 0;
+  __sync_synchronize();
+  for (int y = 0; y < height; ++y) {
+    memcpy(slot + sizeof(uint64_t) + y * width, frameMask.ptr<unsigned char>(y), width);
+  }
+  __sync_synchronize();
+  *slotFrame = frame;
+  ring.header->threshold = threshold;
+  __sync_synchronize();
+  ring.header->latestFrame = frame;
+}
+
+void closeDepthRing(DepthRing& ring)
+{
+  munmap(ring.data, ring.size);
+  close(ring.fd);
+}
+
 std::string tostr(int x)
 {
     std::stringstream str;
@@ -130,6 +232,9 @@ int main(int argc, char *argv[])
   float transform_p4x = -1;
   float transform_p4y = -1;
   std::string filename ("test_" );
+  std::string ringPath;
+  DepthRing ring;
+  bool ringOpen = false;
 
   for(int argI = 1; argI < argc; ++argI)
   {
@@ -212,6 +317,12 @@ int main(int argc, char *argv[])
 
       argI += 8;
     }
+    else if (arg == "-s") {
+      ringPath = argv[argI+1];
+      std::cout << "writing masks to depth ring " << ringPath << std::endl;
+
+      argI += 1;
+    }
     else if (arg == "-o") {
       std::string pathString (argv[argI+1]);
 
@@ -278,7 +389,7 @@ int main(int argc, char *argv[])
     //cv::imshow("undistorted", cv::Mat(undistorted.height, undistorted.width, CV_32FC1, undistorted.data) / 4500.0f);
     //cv::imshow("registered", cv::Mat(registered.height, registered.width, CV_8UC4, registered.data));
 
-    if (i > 10) {
+    if (ringPath.empty() && i > 10) {
       i = 0;
       for (int j=0; j<=10; j++) {
         std::string jIndex = tostr(j);
@@ -320,11 +431,20 @@ int main(int argc, char *argv[])
 
     cv::imshow("output", output);
 
-    std::string index = tostr(i);
-    cv::imwrite((filename + index + ".png").c_str(), output);
-    i += 1;
+    if (!ringPath.empty()) {
+      if (!ringOpen) {
+        ringOpen = openDepthRing(ring, ringPath, output.cols, output.rows, threshold);
+      }
+      if (ringOpen) {
+        writeDepthRing(ring, output, threshold);
+      }
+    } else {
+      std::string index = tostr(i);
+      cv::imwrite((filename + index + ".png").c_str(), output);
+      i += 1;
+    }
 
-    int key = cv::waitKey(1000);
+    int key = cv::waitKey(ringPath.empty() ? 1000 : 1);
     protonect_shutdown = protonect_shutdown || (key > 0 && ((key & 0xFF) == 27)); // shutdown on escape
     if (!protonect_shutdown) {
       std::cout << "key=" << (key & 0xFF) << std::endl;
@@ -348,5 +468,9 @@ int main(int argc, char *argv[])
 
   delete registration;
 
+  if (ringOpen) {
+    closeDepthRing(ring);
+  }
+
   return 0;
 }
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+import random, timeit, numpy, pygame
+
+from blobmanager import BlobManager
+from blobstore import Blob
+from roadmanager import RoadManager
+from roadbuilder import RoadBuilder
+from simulator import Simulator
+from scheduler import Scheduler
+from mapsource import createMapSource
+from simclock import ManualClock
+from citylog import log, LogLevel
+
+try:
+  import resource
+except ImportError:
+  resource = None # not available on windows
+
+# name, blobs seeded before the run, motive population
+citySizes = [
+  ("small", 100, 500),
+  ("medium", 1000, 2000),
+  ("large", 3000, 5000)
+]
+
+def peakMemory():
+  if resource is None:
+    return None
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 # kilobytes on linux
+
+class HeadlessSimulation:
+  def __init__(self, mapSpec, screenDim=(1024, 786), seed=0, threshold=600, draw=True, workers=0, deterministic=False):
+    random.seed(seed)
+    numpy.random.seed(seed)
+
+    self.screenDim = screenDim
+    self.clock = ManualClock()
+    self.mapSource = createMapSource(mapSpec, screenDim, threshold)
+    if hasattr(self.mapSource, "clock"):
+      self.mapSource.clock = lambda: self.clock.getTicks() / 1000.0
+
+    self.blobManager = BlobManager(screenDim, None, self.clock, blobFile=None, growthSeed=seed)
+    if workers:
+      self.blobManager.enableTiles(workers)
+    self.roadManager = RoadManager(screenDim, self.blobManager)
+    self.roadBuilder = RoadBuilder(self.roadManager)
+    self.simulator = Simulator(self.blobManager, self.roadManager, self.clock)
+
+    self.mapData = None
+    self.screen = pygame.Surface(screenDim) if draw else None
+    self.currentBlobManagerScore = 0
+
+    # deterministic runs never shed on time and wait for every road job,
+    # otherwise the timings depend on the machine just like in Main
+    self.deterministic = deterministic
+
+    # the same tasks at the same rates as Main, stepped by the manual clock
+    self.scheduler = Scheduler(budget=None if deterministic else 15.0, profiler=self)
+    self.scheduler.add("map", self.applyMap, 1.0)
+    self.scheduler.add("motives", self.simulator.update, 40.0)
+    self.scheduler.add("blobs", self.blobManager.update, 5.0, shed=True)
+    self.scheduler.add("roads", self.roadManager.update, 10.0)
+    self.scheduler.add("roads.validate", self.validateRoads)
+    self.scheduler.add("score", self.checkScore, 0.1)
+    self.lastTicks = self.clock.getTicks()
+
+    self.timings = {}
+    self.ticks = 0
+    self.applyMap()
+
+  def timed(self, name, function, *args):
+    start = timeit.default_timer()
+    result = function(*args)
+    self.timings.setdefault(name, []).append((timeit.default_timer() - start) * 1000.0)
+    return result
+
+  def applyMap(self, dt=None):
+    # loads synchronously so every run sees the same maps at the same ticks
+    self.mapSource.load()
+    loaded = self.mapSource.poll()
+    if loaded:
+      self.mapData, occupancy, dirtyTiles = loaded
+      self.blobManager.occupancy = occupancy
+      self.blobManager.invalidate(dirtyTiles)
+      self.roadManager.invalidate(dirtyTiles)
+      self.scheduler.trigger("roads.validate")
+
+  def validateRoads(self, dt):
+    self.roadManager.revalidateDirty()
+    self.roadManager.updateGraph()
+
+  def populate(self, blobCount, motiveCount, attemptsPerBlob=20):
+    blobManager = self.blobManager
+    for i in range(blobCount * attemptsPerBlob):
+      if len(blobManager.store) >= blobCount:
+        break
+
+      blob = Blob((random.random() * self.screenDim[0], random.random() * self.screenDim[1]), 1)
+      if blobManager.validate(blob):
+        blobManager.addBlob(blob)
+
+    self.simulator.targetPopulation = motiveCount
+    self.timed("regenerate", self.roadManager.regenerate)
+
+    # start at full population instead of ramping up one motive per tick
+    if len(self.roadManager.roads) > 0:
+      self.simulator.spawn(motiveCount)
+
+  def checkScore(self, dt):
+    newScore = self.blobManager.calculateScore()
+    if newScore > self.currentBlobManagerScore:
+      self.currentBlobManagerScore = newScore
+      if not self.roadBuilder.isBusy():
+        self.roadBuilder.request()
+        if self.deterministic:
+          self.timed("roads.wait", self.roadBuilder.wait)
+
+  def draw(self):
+    if self.mapData:
+      self.screen.blit(self.mapData, [0, 0])
+    else:
+      self.screen.fill((0, 0, 0))
+
+    self.blobManager.draw(self.screen)
+    self.roadManager.draw(self.screen)
+    self.simulator.draw(self.screen)
+
+  def step(self, dt):
+    self.clock.advance(int(dt * 1000))
+    ticks = self.clock.getTicks()
+    elapsed = (ticks - self.lastTicks) / 1000.0
+    self.lastTicks = ticks
+
+    self.timed("roads.swap", self.roadBuilder.update)
+    self.timed("update", self.scheduler.update, elapsed)
+    if self.screen:
+      self.timed("draw", self.draw)
+    self.ticks += 1
+
+  def run(self, ticks, dt=0.025):
+    for i in range(ticks):
+      self.step(dt)
+
+  def report(self, name):
+    memory = peakMemory()
+    print "city %s: %d blobs, %d roads, %d motives after %d ticks, peak memory %s" % (
+      name, len(self.blobManager.store), len(self.roadManager.roads), len(self.simulator.motives), self.ticks,
+      "%.1f MB" % memory if memory is not None else "unknown")
+    print "  %-22s %5s %9s %9s %9s  (ms)" % ("subsystem", "calls", "mean", "p95", "p99")
+    for subsystem in ["update", "update.map", "update.blobs", "update.roads", "update.roads.validate", "roads.swap",
+        "roads.wait", "update.motives", "update.score", "regenerate", "draw"]:
+      timings = self.timings.get(subsystem)
+      if timings:
+        print "  %-22s %5d %9.3f %9.3f %9.3f" % (subsystem, len(timings), numpy.mean(timings),
+          numpy.percentile(timings, 95), numpy.percentile(timings, 99))
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="run the simulation headless and report per subsystem timings")
+  parser.add_argument("--map", default="map.png", help="map image, image directory or glob, .ring or .capture")
+  parser.add_argument("--ticks", type=int, default=200)
+  parser.add_argument("--dt", type=float, default=0.025, help="simulated seconds per tick")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--size", action="append", choices=[size[0] for size in citySizes],
+    help="city sizes to run, all of them by default")
+  parser.add_argument("--no-draw", dest="draw", action="store_false", help="skip drawing to an offscreen surface")
+  parser.add_argument("--workers", type=int, default=0, help="grow blobs tile by tile in this many processes")
+  parser.add_argument("--deterministic", action="store_true",
+    help="never shed blob ticks on time and wait for road jobs, for comparing runs")
+  args = parser.parse_args()
+  log.setLevel(LogLevel.Warning) # keep the report readable
+
+  for name, blobCount, motiveCount in citySizes:
+    if args.size and name not in args.size:
+      continue
+
+    simulation = HeadlessSimulation(args.map, seed=args.seed, draw=args.draw, workers=args.workers,
+      deterministic=args.deterministic)
+    simulation.populate(blobCount, motiveCount)
+    simulation.run(args.ticks, args.dt)
+    simulation.report(name)
+    simulation.roadBuilder.close()
+    simulation.mapSource.close()
+    simulation.blobManager.close()
@@ -0,0 +1,171 @@
+# -*- coding: utf8 -*-
+
+import numpy
+
+class BlobGrowth:
+  def __init__(self, blobManager, seed=None):
+    self.blobManager = blobManager
+    self.random = numpy.random.RandomState(seed)
+
+    self.jitterSteps = 5
+    self.driftChance = 0.5
+
+  def seed(self, seed):
+    self.random = numpy.random.RandomState(seed)
+
+  def randomUnitCircle(self, shape):
+    d = self.random.random_sample(shape) * numpy.pi
+    signX = self.random.choice([1, -1], shape)
+    signY = self.random.choice([1, -1], shape)
+    return numpy.cos(d) * signX, numpy.sin(d) * signY
+
+  def findPairsAt(self, xs, ys, reach):
+    # (local index, neighbour slot) for every blob within reach of a position
+    first, second = self.blobManager.blobIndex.queryMany(xs.tolist(), ys.tolist(), reach.tolist())
+    return numpy.array(first, dtype=numpy.int64), numpy.array(second, dtype=numpy.int64)
+
+  def findPairs(self, slots, reach):
+    store = self.blobManager.store
+    first, second = self.findPairsAt(store.x[slots], store.y[slots], reach)
+    notSelf = second != slots[first]
+    return first[notSelf], second[notSelf]
+
+  def collides(self, count, first, second, xs, ys, radii):
+    # xs, ys and radii are per local index, tested against the stored neighbours
+    store = self.blobManager.store
+    dx = xs[first] - store.x[second]
+    dy = ys[first] - store.y[second]
+    reach = radii[first] + store.radius[second]
+    hits = (dx * dx + dy * dy) < reach * reach
+    return numpy.bincount(first[hits], minlength=count) > 0
+
+  def isValid(self, xs, ys, radii, first, second):
+    count = len(xs)
+    occupancy = self.blobManager.occupancy
+    result = ~occupancy.disksAreSet(xs, ys, radii)
+    result &= ~self.collides(count, first, second, xs, ys, radii)
+    return result
+
+  def findInvalid(self, dirtyTiles=None):
+    store = self.blobManager.store
+    slots = store.activeSlots()
+    if len(slots) == 0 or not self.blobManager.occupancy:
+      return slots
+
+    if dirtyTiles is not None:
+      x = store.x[slots]
+      y = store.y[slots]
+      radii = store.radius[slots]
+      slots = slots[dirtyTiles.touches(x - radii, y - radii, x + radii, y + radii)]
+      if len(slots) == 0:
+        return slots
+
+    radii = store.radius[slots].astype(numpy.int64)
+    first, second = self.findPairs(slots, radii + self.blobManager.maxBlobRadius)
+    valid = self.isValid(store.x[slots], store.y[slots], radii, first, second)
+    return slots[~valid]
+
+  def step(self):
+    store = self.blobManager.store
+    slots = store.activeSlots()
+    count = len(slots)
+    if count == 0 or not self.blobManager.occupancy:
+      return slots[:0], slots
+
+    accepted, newX, newY, newR, first, second = self.propose(slots)
+
+    movedSlots = slots[accepted]
+    store.x[movedSlots] = newX[accepted]
+    store.y[movedSlots] = newY[accepted]
+    store.radius[movedSlots] = newR[accepted]
+
+    return movedSlots, slots[~accepted]
+
+  def propose(self, slots):
+    # the grown state of every given blob, the store is left untouched
+    store = self.blobManager.store
+    count = len(slots)
+    x = store.x[slots]
+    y = store.y[slots]
+    radii = store.radius[slots].astype(numpy.int64)
+
+    # candidate 0 grows in place, candidates 1..n grow at a cumulative
+    # random jitter, the last one drifts to the final jitter at the old size
+    steps = self.jitterSteps
+    jitterX, jitterY = self.randomUnitCircle((count, steps))
+    scale = self.random.random_sample((count, steps)) * numpy.arange(steps)
+    offsetX = numpy.cumsum(jitterX * scale, axis=1)
+    offsetY = numpy.cumsum(jitterY * scale, axis=1)
+    allowDrift = self.random.random_sample(count) > self.driftChance
+
+    candidatesX = numpy.column_stack([x, x[:, None] + offsetX[:, 1:], x + offsetX[:, -1]])
+    candidatesY = numpy.column_stack([y, y[:, None] + offsetY[:, 1:], y + offsetY[:, -1]])
+    candidatesR = numpy.column_stack([radii + 1] * steps + [radii])
+    candidateCount = candidatesX.shape[1]
+
+    # a neighbour may jitter towards the blob as well, so its offset is covered too
+    maxOffset = numpy.ceil(numpy.sqrt(offsetX * offsetX + offsetY * offsetY).max(axis=1)).astype(numpy.int64)
+    reach = radii + 1 + maxOffset + maxOffset.max() + self.blobManager.maxBlobRadius + 1
+    first, second = self.findPairs(slots, reach)
+
+    valid = numpy.zeros((count, candidateCount), dtype=numpy.bool_)
+    for k in range(candidateCount):
+      valid[:, k] = self.isValid(candidatesX[:, k], candidatesY[:, k], candidatesR[:, k], first, second)
+    valid[:, -1] &= allowDrift
+
+    accepted = valid.any(axis=1)
+    choice = valid.argmax(axis=1)
+    rows = numpy.arange(count)
+    newX = numpy.where(accepted, candidatesX[rows, choice], x)
+    newY = numpy.where(accepted, candidatesY[rows, choice], y)
+    newR = numpy.where(accepted, candidatesR[rows, choice], radii)
+
+    # every candidate was scored against the old neighbours, so only two
+    # accepted neighbours can still overlap; the later one keeps its old state.
+    # a pair may only be found from the side with the larger reach, so both
+    # directions are checked. neighbours outside the given slots are left to the caller
+    localOf = numpy.full(store.capacity, -1, dtype=numpy.int64)
+    localOf[slots] = rows
+    other = localOf[second]
+    inside = (other >= 0) & (other != first)
+    low = numpy.minimum(first[inside], other[inside])
+    high = numpy.maximum(first[inside], other[inside])
+    pairs = numpy.unique(low * count + high)
+    low = pairs // count
+    high = pairs % count
+    both = accepted[low] & accepted[high]
+    low = low[both]
+    high = high[both]
+    dx = newX[low] - newX[high]
+    dy = newY[low] - newY[high]
+    reachR = newR[low] + newR[high]
+    rejected = high[(dx * dx + dy * dy) < reachR * reachR]
+    accepted[rejected] = False
+
+    return accepted, newX, newY, newR, first, second
+
+  def findMerges(self, slots, radiusFactor):
+    # slots and partner slots of the closest merge each blob could do,
+    # checked like BlobManager.tryMergeBlob checks a merged blob
+    store = self.blobManager.store
+    x = store.x[slots]
+    y = store.y[slots]
+    reach = store.radius[slots] * radiusFactor
+    first, second = self.findPairs(slots, numpy.ceil(reach).astype(numpy.int64))
+    distance = (store.x[second] - x[first]) ** 2 + (store.y[second] - y[first]) ** 2
+    close = distance < reach[first] ** 2
+    first = first[close]
+    second = second[close]
+    distance = distance[close]
+
+    mergedX = ((store.x[second] + x[first]) / 2.0).astype(numpy.int64)
+    mergedY = ((store.y[second] + y[first]) / 2.0).astype(numpy.int64)
+    mergedR = store.radius[second].astype(numpy.int64) + store.radius[slots[first]]
+    near, other = self.findPairsAt(mergedX, mergedY, mergedR + self.blobManager.maxBlobRadius)
+    merged = (other == slots[first][near]) | (other == second[near]) # the pair itself goes away
+    valid = numpy.flatnonzero(self.isValid(mergedX, mergedY, mergedR, near[~merged], other[~merged]))
+
+    # closest valid partner first, one merge per blob
+    valid = valid[numpy.lexsort((distance[valid], first[valid]))]
+    valid = valid[numpy.unique(first[valid], return_index=True)[1]]
+    return slots[first[valid]], second[valid]
@@ -0,0 +1,180 @@
+# -*- coding: utf8 -*-
+
+import os, glob, struct, threading
+from citylog import log
+
+class JournalEvent:
+  Spawn = 1
+  Remove = 2
+  Mutate = 3
+  Merge = 4
+  Die = 5
+
+addEvents = [JournalEvent.Spawn, JournalEvent.Merge]
+removeEvents = [JournalEvent.Remove, JournalEvent.Die]
+
+# header: magic, format version, sequence number of the journal segment
+journalMagic = "CSJL"
+journalVersion = 1
+journalHeader = struct.Struct("<4sHxxI")
+# record: event, blob id, x, y, radius, state
+journalRecord = struct.Struct("<Bqddii")
+
+def journalFilename(base, sequence):
+  return "%s.%d" % (base, sequence)
+
+def findJournals(base):
+  result = []
+  for filename in glob.glob(base + ".*"):
+    suffix = filename[len(base) + 1:]
+    if suffix.isdigit():
+      result.append((int(suffix), filename))
+
+  result.sort()
+  return result
+
+def removeJournals(base, before):
+  for sequence, filename in findJournals(base):
+    if sequence < before:
+      try:
+        os.remove(filename)
+      except OSError as e:
+        log.warning("journal", "removing blob journal failed: %s", e)
+
+def readJournal(filename):
+  with open(filename, 'rb') as f:
+    header = f.read(journalHeader.size)
+    if len(header) < journalHeader.size:
+      return
+    magic, version, sequence = journalHeader.unpack(header)
+    if magic != journalMagic or version != journalVersion:
+      raise ValueError("unsupported blob journal " + filename)
+
+    while True:
+      data = f.read(journalRecord.size)
+      if len(data) < journalRecord.size:
+        break # a torn record at the tail is the last write before a crash
+      yield journalRecord.unpack(data)
+
+def replayJournal(store, filename):
+  count = 0
+  for event, id, x, y, radius, state in readJournal(filename):
+    slot = store.slotOf(id)
+    if event in addEvents:
+      if slot >= 0:
+        store.remove(slot)
+      store.add(x, y, radius, state, id)
+    elif event in removeEvents:
+      if slot >= 0:
+        store.remove(slot)
+    elif slot >= 0:
+      store.x[slot] = x
+      store.y[slot] = y
+      store.radius[slot] = radius
+      store.state[slot] = state
+    count += 1
+
+  return count
+
+class BlobJournal:
+  # records are packed on the calling thread, a writer thread appends and
+  # syncs them so a flush never waits for the disk, like SnapshotWriter
+  def __init__(self, base, sequence):
+    self.base = base
+    self.sequence = sequence
+    self.dirty = set()
+    self.records = [] # packed since the last flush
+    self.pending = [] # (sequence, data) waiting for the writer
+    self.file = None # only touched by the writer thread
+    self.fileSequence = None
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.running = True
+
+    self.thread = threading.Thread(target=self.run, name="blob journal writer")
+    self.thread.daemon = True
+    self.thread.start()
+
+  def open(self, sequence):
+    if self.file:
+      self.file.close()
+      self.file = None
+      self.fileSequence = None
+
+    self.file = open(journalFilename(self.base, sequence), 'ab')
+    self.fileSequence = sequence
+    if self.file.tell() == 0:
+      self.file.write(journalHeader.pack(journalMagic, journalVersion, sequence))
+
+  def append(self, event, id, x, y, radius, state):
+    self.records.append(journalRecord.pack(event, id, x, y, radius, state))
+
+  def recordAt(self, event, store, slot):
+    id = int(store.ids[slot])
+    self.append(event, id, store.x[slot], store.y[slot], store.radius[slot], store.state[slot])
+    self.dirty.discard(id)
+
+  def recordRemoved(self, event, id):
+    self.append(event, id, 0.0, 0.0, 0, 0)
+    self.dirty.discard(id)
+
+  def markDirty(self, ids):
+    # mutations are coalesced and only the last state is written on flush;
+    # only moves and growth are marked, state counters wait for the snapshot
+    self.dirty.update(ids)
+
+  def flush(self, store):
+    dirty = self.dirty
+    self.dirty = set()
+    for id in dirty:
+      slot = store.slotOf(id)
+      if slot >= 0:
+        self.recordAt(JournalEvent.Mutate, store, slot)
+
+    if self.records:
+      data = "".join(self.records)
+      self.records = []
+      with self.lock:
+        self.pending.append((self.sequence, data))
+      self.wakeup.set()
+
+  def run(self):
+    while self.running:
+      self.wakeup.wait()
+      self.wakeup.clear()
+      self.writePending()
+
+  def writePending(self):
+    with self.lock:
+      pending = self.pending
+      self.pending = []
+
+    for sequence, data in pending:
+      try:
+        self.writeNow(sequence, data)
+      except (IOError, OSError) as e:
+        log.error("journal", "writing blob journal failed: %s", e)
+
+  def writeNow(self, sequence, data):
+    if self.fileSequence != sequence:
+      self.open(sequence)
+    self.file.write(data)
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+  def rotate(self, store):
+    # records after this go to a new segment, the writer opens it with them
+    self.flush(store)
+    self.sequence += 1
+    return self.sequence
+
+  def close(self, store):
+    self.flush(store)
+    self.running = False
+    self.wakeup.set()
+    self.thread.join()
+
+    self.writePending()
+    if self.file:
+      self.file.close()
+      self.file = None
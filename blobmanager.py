@@ -1,89 +1,227 @@
 # -*- coding: utf8 -*-
 
-import pygame,  jsonpickle, uuid, math
+import pygame, math, numpy
 from os import path
 from random import choice, random, randint
 from vector import Vector
-
-class Blob:
-  def __init__(self, pos, radius):
-    self.id = str(uuid.uuid1())
-    self.pos = Vector(pos)
-    self.radius = radius
-    self.state = 0
-    self.roads = []
-
-  def clone(self):
-    result = Blob(self.pos, self.radius)
-    result.id = self.id
-    result.state = self.state
-    result.roads = self.roads
-    return result
-
-  def __getstate__(self):
-    return [self.id, self.pos, self.radius, self.state]
-
-  def __setstate__(self, stateData):
-    self.id = stateData[0]
-    self.pos = stateData[1]
-    self.radius = stateData[2]
-    self.state = stateData[3]
-    self.roads = []
-
-class BlobManager:
-  def __init__(self, screenDim, mapData):
-    self.mapData = mapData
+from spatialhash import SpatialHash
+from blobstore import Blob, BlobStore
+from blobgrowth import BlobGrowth
+from blobtiles import TiledGrowth
+from blobpersistence import isSnapshot, readSnapshot, readLegacyBlobs, SnapshotWriter
+from simclock import PygameClock
+from citylog import log, LogLevel
+from blobjournal import JournalEvent, BlobJournal, findJournals, removeJournals, replayJournal
+
+class BlobManager(object):
+  def __init__(self, screenDim, occupancy, clock=None, blobFile="blobs.bin", growthSeed=None):
+    self.occupancy = occupancy
     self.screenDim = screenDim
-
-    self.blobs = []
-    self.blobDict = {}
+    self.clock = clock or PygameClock()
+
+    self.store = BlobStore()
+    self.blobDict = self.store
+    self.blobIndexCellSize = 32
+    self.blobIndex = SpatialHash(self.blobIndexCellSize)
+    self.maxBlobRadius = 0
+    self.dirtyTiles = None
+    self.version = 0 # bumped whenever the drawn blobs change
+    self.blobSetVersion = 0 # bumped only when blobs are added or removed
+    self.addedBlobs = set() # blob ids changed since the road manager last looked
+    self.movedBlobs = set()
+    self.removedBlobs = set()
     self.blobColor = (200, 200, 200)
     self.drawBlobs = True
 
     self.blobPersistenceInterval = 10000
     self.lastPersistence = 0
+    self.snapshotWriter = None
+
+    self.journal = None
+    self.journalFile = "blobs.journal"
+    self.journalInterval = 1000
+    self.lastJournalFlush = 0
+
+    self.batchGrowth = True
+    self.growth = BlobGrowth(self, growthSeed) # reseed later with growth.seed()
+    self.tiles = None # spreads growth over worker processes once enabled
 
     self.blobMergeLimit = 10
     self.blobMergeRadiusFactor = 2.5
     self.spawnRate = 1000
     self.lastSpawn = 0
 
-    self.blobFile = "blobs.json"
+    # without a blob file nothing is loaded or persisted
+    self.blobFile = blobFile
+    if not self.blobFile:
+      return
+
+    self.legacyBlobFile = "blobs.json"
+    journalSequence = 0
     if path.isfile(self.blobFile):
-      print "loading existing blobs..."
-      with open(self.blobFile, 'r') as f:
-        content = f.read()
-        self.blobs = jsonpickle.decode(content)
-        for b in self.blobs:
-          self.blobDict[b.id] = b
-      print "done."
+      journalSequence = self.loadBlobs(self.blobFile)
+    elif path.isfile(self.legacyBlobFile):
+      journalSequence = self.loadBlobs(self.legacyBlobFile)
+
+    for sequence, filename in findJournals(self.journalFile):
+      if sequence >= journalSequence:
+        count = replayJournal(self.store, filename)
+        log.info("journal", "replayed %d entries from %s", count, filename)
+        journalSequence = sequence + 1
+    self.rebuildIndex()
+
+    self.journal = BlobJournal(self.journalFile, journalSequence)
+
+  def loadBlobs(self, filename):
+    log.info("blobs", "loading existing blobs from %s...", filename)
+    journalSequence = 0
+    if isSnapshot(filename):
+      snapshot = readSnapshot(filename, mmap=True)
+      self.store.load(snapshot)
+      journalSequence = snapshot["journalSequence"]
+    else:
+      for b in readLegacyBlobs(filename):
+        self.addBlob(b)
+    log.info("blobs", "loaded %d blobs", len(self.store))
 
-  def persistBlobs(self):
-    print "persisting blobs..."
-    blobData = jsonpickle.encode(self.blobs)
-    with open(self.blobFile, 'w') as f:
-      f.write(blobData)
-    print "done."
+    return journalSequence
 
-  def isSet(self, pos):
-    if not self.mapData:
-      print "no mapData yet"
-      return True
+  @property
+  def blobs(self):
+    return self.store.views()
 
-    if not isinstance(pos, Vector):
-      pos = Vector(pos)
+  def addBlob(self, blob, event=JournalEvent.Spawn):
+    blobId = blob.id
+    if not isinstance(blobId, (int, long)):
+      blobId = None # legacy uuid ids are replaced by store ids
 
-    if pos.x < 0 or pos.y < 0:
-      return True
-    if pos.x >= self.screenDim[0] or pos.y >= self.screenDim[1]:
+    pos = blob.pos
+    slot = self.store.add(pos.x, pos.y, blob.radius, blob.state, blobId)
+    self.blobIndex.insert(int(self.store.ids[slot]), pos, slot)
+    self.maxBlobRadius = max(self.maxBlobRadius, blob.radius)
+    self.addedBlobs.add(int(self.store.ids[slot]))
+    self.version += 1
+    self.blobSetVersion += 1
+    if self.journal:
+      self.journal.recordAt(event, self.store, slot)
+    return self.store.view(slot)
+
+  def removeBlob(self, blob, event=JournalEvent.Remove):
+    slot = self.store.slotOf(blob.id)
+    if slot < 0:
+      return
+
+    if self.journal:
+      self.journal.recordRemoved(event, blob.id)
+    self.blobIndex.remove(blob.id)
+    self.store.remove(slot)
+    self.addedBlobs.discard(blob.id)
+    self.movedBlobs.discard(blob.id)
+    self.removedBlobs.add(blob.id)
+    self.version += 1
+    self.blobSetVersion += 1
+
+  def replaceBlobAt(self, slot, newBlob):
+    store = self.store
+    pos = newBlob.pos
+    store.x[slot] = pos.x
+    store.y[slot] = pos.y
+    store.radius[slot] = newBlob.radius
+    store.state[slot] = newBlob.state
+    self.blobIndex.update(newBlob.id, pos, slot)
+    self.maxBlobRadius = max(self.maxBlobRadius, newBlob.radius)
+    self.movedBlobs.add(newBlob.id)
+    self.version += 1
+    if self.journal:
+      self.journal.markDirty([newBlob.id])
+
+  def rebuildIndex(self):
+    store = self.store
+    slots = store.activeSlots()
+    self.blobIndex.clear()
+    self.maxBlobRadius = 0
+    for slot in slots.tolist():
+      self.blobIndex.insert(int(store.ids[slot]), (store.x[slot], store.y[slot]), slot)
+
+    if len(slots) > 0:
+      self.maxBlobRadius = int(store.radius[slots].max())
+
+  def reindexSlots(self, slots):
+    store = self.store
+    for slot in slots.tolist():
+      self.blobIndex.update(int(store.ids[slot]), (store.x[slot], store.y[slot]), slot)
+
+    if len(slots) > 0:
+      self.maxBlobRadius = max(self.maxBlobRadius, int(store.radius[slots].max()))
+
+    ids = store.ids[slots].tolist()
+    self.movedBlobs.update(ids)
+    if len(ids) > 0:
+      self.version += 1
+    if self.journal:
+      self.journal.markDirty(ids)
+
+  def takeBlobChanges(self):
+    # blobs added, moved or grown, and removed since the last call
+    added = self.addedBlobs
+    moved = self.movedBlobs - added
+    removed = self.removedBlobs
+    self.addedBlobs = set()
+    self.movedBlobs = set()
+    self.removedBlobs = set()
+    return added, moved, removed
+
+  def persistBlobs(self):
+    if not self.blobFile:
+      return
+
+    log.info("blobs", "persisting %d blobs", len(self.store))
+    if self.snapshotWriter is None:
+      self.snapshotWriter = SnapshotWriter(self.blobFile, self.compactJournal)
+
+    # the snapshot covers every journal segment before the freshly opened one
+    journalSequence = self.journal.rotate(self.store) if self.journal else 0
+    snapshot = self.store.snapshot()
+    snapshot["journalSequence"] = journalSequence
+    self.snapshotWriter.write(snapshot)
+
+  def compactJournal(self, snapshot):
+    removeJournals(self.journalFile, snapshot["journalSequence"])
+
+  def enableTiles(self, workers=None, tileSize=256):
+    if self.tiles:
+      self.tiles.close()
+    self.tiles = TiledGrowth(self, workers, tileSize)
+
+  def close(self):
+    if self.tiles:
+      self.tiles.close()
+      self.tiles = None
+
+    if self.snapshotWriter:
+      self.snapshotWriter.close()
+      self.snapshotWriter = None
+
+    if self.journal:
+      self.journal.close(self.store)
+      self.journal = None
+
+  def invalidate(self, dirtyTiles):
+    if self.dirtyTiles is None:
+      self.dirtyTiles = dirtyTiles
+    else:
+      self.dirtyTiles = self.dirtyTiles.merge(dirtyTiles)
+
+  def isSet(self, pos):
+    if not self.occupancy:
+      log.debug("map", "no mapData yet")
       return True
 
-    px = self.mapData.get_at(pos.toIntArr())
-    return (px.r + px.g + px.b) < 600
+    return self.occupancy.isSet(pos[0], pos[1])
 
-  def mutateAt(self, index):
+  def mutateAt(self, slot):
     result = False
-    blob = self.blobs[index]
+    blob = self.store.view(slot)
     newBlob = blob.clone()
 
     newBlob.radius += 1
@@ -109,43 +247,38 @@ class BlobManager:
 
 
     if result:
-      self.blobs[index] = newBlob
+      self.replaceBlobAt(slot, newBlob)
 
     return result
 
-  def validate(self, blob, debug=False):
+  def validate(self, blob, debug=False, exclude=()):
+    # exclude holds ids of blobs the new one may overlap, like the two it merges
     result = True
     pos = blob.pos
     if self.isSet(pos):
       if debug:
-        print "isset fail"
+        log.debug("validate", "isset fail")
       result = False
     else:
-      radius = blob.radius
-      sqrRadius = radius**2
-      for x in range(-radius, radius):
-        for y in range(-radius, radius):
-          if x*x + y*y <= sqrRadius:
-            cPos = pos + [x, y]
-            if self.isSet(cPos):
-              if debug:
-                print "wall collision fail"
-              result = False
-              break
-
-        if not result:
-          break
-
-      for otherBlob in self.blobs:
-        if otherBlob.id == blob.id:
-          continue
-
-        distance = Vector.distanceSqr(otherBlob.pos, blob.pos)
-        if distance < (otherBlob.radius + blob.radius) ** 2:
+      if self.occupancy.diskIsSet(pos.x, pos.y, blob.radius):
+        if debug:
+          log.debug("validate", "wall collision fail")
+        result = False
+
+      slots = self.blobIndex.query(pos, blob.radius + self.maxBlobRadius)
+      if len(slots) > 0:
+        store = self.store
+        slots = numpy.array(slots)
+        ids = store.ids[slots]
+        distance = (store.x[slots] - pos.x) ** 2 + (store.y[slots] - pos.y) ** 2
+        hits = distance < (store.radius[slots] + blob.radius) ** 2
+        for blobId in (blob.id,) + tuple(exclude):
+          if isinstance(blobId, (int, long)):
+            hits &= ids != blobId
+        if hits.any():
           if debug:
-            print "blob collision fail"
+            log.debug("validate", "blob collision fail")
           result = False
-          break
 
 
     return result
@@ -159,13 +292,14 @@ class BlobManager:
   def findCloseBlobs(self, blob, radius):
     result = []
 
-    radiusSqr = radius * radius
-    for otherBlob in self.blobs:
-      if otherBlob.id == blob.id:
-        continue
-
-      if Vector.distanceSqr(blob.pos, otherBlob.pos) < radiusSqr:
-        result.append(otherBlob)
+    slots = self.blobIndex.query(blob.pos, radius)
+    if len(slots) > 0:
+      store = self.store
+      pos = blob.pos
+      slots = numpy.array(slots)
+      distance = (store.x[slots] - pos.x) ** 2 + (store.y[slots] - pos.y) ** 2
+      close = (distance < radius * radius) & (store.ids[slots] != blob.id)
+      result = store.views(slots[close])
 
     return result
 
@@ -173,19 +307,23 @@ class BlobManager:
     otherBlobs = self.findCloseBlobs(blob, blob.radius * self.blobMergeRadiusFactor)
 
     for otherBlob in otherBlobs:
-      center = ((otherBlob.pos + blob.pos) / 2.0).toIntArr()
-      newBlob = Blob(center, blob.radius + otherBlob.radius)
-
-      if self.validate(newBlob):
-        print "mergedBlob at", blob.pos
-        self.blobs.remove(blob)
-        self.blobs.remove(otherBlob)
-        self.blobs.append(newBlob)
-        self.blobDict.pop(blob.id, None)
-        self.blobDict.pop(otherBlob.id, None)
-        self.blobDict[newBlob.id] = newBlob
+      if self.mergeBlobs(blob, otherBlob):
         break
 
+  def mergeBlobs(self, blob, otherBlob):
+    center = ((otherBlob.pos + blob.pos) / 2.0).toIntArr()
+    newBlob = Blob(center, blob.radius + otherBlob.radius)
+    if not self.validate(newBlob, exclude=(blob.id, otherBlob.id)):
+      return False
+
+    log.count("blobs merged")
+    if log.isEnabled(LogLevel.Debug):
+      log.debug("blobs", "merged blob at %s", blob.pos)
+    self.removeBlob(blob)
+    self.removeBlob(otherBlob)
+    self.addBlob(newBlob, JournalEvent.Merge)
+    return True
+
   def getLocationNextToRandomBlob(self):
     x = -1
     y = -1
@@ -204,25 +342,24 @@ class BlobManager:
     return [x, y]
 
   def removeAt(self, pos):
-    for blob in self.blobs:
+    for blob in self.store.views(self.blobIndex.query(pos, self.maxBlobRadius)):
       dist = Vector.distanceSqr(blob.pos, pos)
-      print dist, blob.radius ** 2
       if dist < blob.radius ** 2:
-        self.blobs.remove(blob)
-        self.blobDict.pop(blob.id, None)
+        self.removeBlob(blob)
         break
 
   def spawnAt(self, pos):
     blob = Blob(pos, 1)
     if self.validate(blob):
-      print "blob spawned at", blob.pos
-      self.blobs.append(blob)
-      self.blobDict[blob.id] = blob
+      log.count("blobs spawned")
+      if log.isEnabled(LogLevel.Debug):
+        log.debug("blobs", "blob spawned at %s", blob.pos)
+      self.addBlob(blob)
 
 
   def spawn(self):
-    if len(self.blobs) > 0:
-      randomBlob = choice(self.blobs)
+    if len(self.store) > 0:
+      randomBlob = self.store.view(choice(self.store.activeSlots()))
 
       pos = randomBlob.pos + (Vector.randomUnitCircle() * randomBlob.radius * 2) * random()
     else:
@@ -233,46 +370,84 @@ class BlobManager:
   def calculateScore(self):
     result = 0
 
-    radiuses = 0.0
-    for blob in self.blobs:
-      radiuses = radiuses + blob.radius
+    radiuses = float(self.store.radius[self.store.activeSlots()].sum())
 
-    return radiuses/(float(len(self.blobs))+0.0001)
+    return radiuses/(float(len(self.store))+0.0001)
 
   def update(self, dt):
+    store = self.store
+    debug = log.isEnabled(LogLevel.Debug) # blob positions are only built for debug output
     blobsToTryMerge = []
-    for i in range(len(self.blobs)):
-      blob = self.blobs[i]
-      if not self.mutateAt(i):
-        blob.state = blob.state + 1
+    if self.tiles and self.occupancy:
+      movedSlots, failedSlots, deadIds, merges = self.tiles.step(self.dirtyTiles)
+      self.dirtyTiles = None
+      self.reindexSlots(movedSlots)
+      store.state[failedSlots] += 1 # not journaled, state is carried by the next snapshot
+
+      deadBlobs = [store.get(blobId) for blobId in deadIds]
+      log.count("blobs died", len(deadBlobs))
+      for blob in deadBlobs:
+        if debug:
+          log.debug("blobs", "removing dead blob at %s", blob.pos)
+        self.removeBlob(blob, JournalEvent.Die)
+
+      # merges were proposed per tile, they are checked again as they happen
+      for blobId, otherId in merges:
+        blob = store.get(blobId)
+        otherBlob = store.get(otherId)
+        if blob and otherBlob:
+          self.mergeBlobs(blob, otherBlob)
+    elif self.batchGrowth:
+      movedSlots, failedSlots = self.growth.step()
+      self.reindexSlots(movedSlots)
+      store.state[failedSlots] += 1
+
+      mergeSlots = failedSlots[store.radius[failedSlots] < self.blobMergeLimit] # merging blobs
+      blobsToTryMerge = store.ids[mergeSlots].tolist()
+    else:
+      for slot in store.activeSlots().tolist():
+        if not self.mutateAt(slot):
+          store.state[slot] += 1
 
-        if blob.radius < self.blobMergeLimit: # merging blobs
-          blobsToTryMerge.append(blob)
+          if store.radius[slot] < self.blobMergeLimit: # merging blobs
+            blobsToTryMerge.append(int(store.ids[slot]))
 
-    for blob in blobsToTryMerge:
-      if blob in self.blobs:
+    for blobId in blobsToTryMerge:
+      blob = store.get(blobId)
+      if blob:
         self.tryMergeBlob(blob)
 
-    deadBlobs = []
-    for blob in self.blobs:
-      if not self.validate(blob): # removing dead blobs
-        deadBlobs.append(blob)
-    for blob in deadBlobs:
-      print "removing dead blob at", blob.pos
-      self.blobs.remove(blob)
-      self.blobDict.pop(blob.id, None)
-
-    time = pygame.time.get_ticks()
+    # growth, merges and spawns are validated as they happen, so blobs can
+    # only die where the map changed since the last sweep
+    dirtyTiles = self.dirtyTiles
+    self.dirtyTiles = None
+    if dirtyTiles is not None and dirtyTiles.any():
+      deadBlobs = store.views(self.growth.findInvalid(dirtyTiles)) # removing dead blobs
+      log.count("blobs died", len(deadBlobs))
+      for blob in deadBlobs:
+        if debug:
+          log.debug("blobs", "removing dead blob at %s", blob.pos)
+        self.removeBlob(blob, JournalEvent.Die)
+
+    time = self.clock.getTicks()
     if self.lastSpawn + self.spawnRate < time:
       self.lastSpawn = time
       self.spawn()
 
-    time = pygame.time.get_ticks()
-    if self.lastPersistence + self.blobPersistenceInterval < time:
+    time = self.clock.getTicks()
+    if self.journal and self.lastJournalFlush + self.journalInterval < time:
+      self.lastJournalFlush = time
+      self.journal.flush(store)
+
+    if self.blobFile and self.lastPersistence + self.blobPersistenceInterval < time:
       self.lastPersistence = time
       self.persistBlobs()
 
   def draw(self, screen):
     if self.drawBlobs:
-      for blob in self.blobs:
-        pygame.draw.circle(screen, self.blobColor, blob.pos.toIntArr(), blob.radius)
+      store = self.store
+      slots = store.activeSlots()
+      xs = store.x[slots].astype(numpy.int32).tolist()
+      ys = store.y[slots].astype(numpy.int32).tolist()
+      for x, y, radius in zip(xs, ys, store.radius[slots].tolist()):
+        pygame.draw.circle(screen, self.blobColor, [x, y], radius)
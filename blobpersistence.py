@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+
+import os, struct, threading, numpy, jsonpickle
+from citylog import log
+
+# header: magic, format version, blob count, next free id and the first
+# journal sequence that is not folded into the snapshot yet (version 2)
+snapshotMagic = "CSBL"
+snapshotVersion = 2
+snapshotHeaders = {
+  1: struct.Struct("<4sHxxIq"),
+  2: struct.Struct("<4sHxxIqI")
+}
+snapshotPrefix = struct.Struct("<4sH")
+
+snapshotColumns = [
+  ("ids", numpy.int64),
+  ("x", numpy.float64),
+  ("y", numpy.float64),
+  ("radius", numpy.int32),
+  ("state", numpy.int32)
+]
+
+def isSnapshot(filename):
+  with open(filename, 'rb') as f:
+    return f.read(len(snapshotMagic)) == snapshotMagic
+
+def replaceFile(source, target):
+  if os.name == 'nt' and os.path.isfile(target):
+    os.remove(target) # rename does not overwrite on windows
+  os.rename(source, target)
+
+def writeSnapshot(filename, snapshot):
+  count = len(snapshot["ids"])
+  tmpFilename = filename + ".tmp"
+  with open(tmpFilename, 'wb') as f:
+    header = snapshotHeaders[snapshotVersion]
+    f.write(header.pack(snapshotMagic, snapshotVersion, count, snapshot["nextId"], snapshot.get("journalSequence", 0)))
+    for name, dtype in snapshotColumns:
+      f.write(numpy.ascontiguousarray(snapshot[name], dtype=dtype).tostring())
+    f.flush()
+    os.fsync(f.fileno())
+  replaceFile(tmpFilename, filename)
+
+def readSnapshot(filename, mmap=False):
+  with open(filename, 'rb') as f:
+    magic, version = snapshotPrefix.unpack(f.read(snapshotPrefix.size))
+    if magic != snapshotMagic or not snapshotHeaders.has_key(version):
+      raise ValueError("unsupported blob snapshot " + filename)
+
+    header = snapshotHeaders[version]
+    f.seek(0)
+    fields = header.unpack(f.read(header.size))
+    count = fields[2]
+
+    snapshot = { "nextId": fields[3], "journalSequence": fields[4] if version >= 2 else 0 }
+    offset = header.size
+    for name, dtype in snapshotColumns:
+      if mmap and count > 0:
+        snapshot[name] = numpy.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(count,))
+      else:
+        snapshot[name] = numpy.fromfile(f, dtype=dtype, count=count)
+      offset += count * numpy.dtype(dtype).itemsize
+
+  return snapshot
+
+def readLegacyBlobs(filename):
+  with open(filename, 'r') as f:
+    return jsonpickle.decode(f.read())
+
+class SnapshotWriter:
+  def __init__(self, filename, onWritten=None):
+    self.filename = filename
+    self.onWritten = onWritten
+    self.pending = None
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.running = True
+
+    self.thread = threading.Thread(target=self.run, name="blob snapshot writer")
+    self.thread.daemon = True
+    self.thread.start()
+
+  def write(self, snapshot):
+    # only the newest snapshot matters, an unwritten older one is dropped
+    with self.lock:
+      self.pending = snapshot
+    self.wakeup.set()
+
+  def run(self):
+    while self.running:
+      self.wakeup.wait()
+      self.wakeup.clear()
+
+      with self.lock:
+        snapshot = self.pending
+        self.pending = None
+
+      if snapshot is not None:
+        try:
+          self.writeNow(snapshot)
+        except (IOError, OSError) as e:
+          log.error("blobs", "writing blob snapshot failed: %s", e)
+
+  def writeNow(self, snapshot):
+    writeSnapshot(self.filename, snapshot)
+    if self.onWritten:
+      self.onWritten(snapshot)
+
+  def close(self):
+    self.running = False
+    self.wakeup.set()
+    self.thread.join()
+
+    if self.pending is not None:
+      self.writeNow(self.pending)
+      self.pending = None
@@ -0,0 +1,233 @@
+# -*- coding: utf8 -*-
+
+import numpy
+from vector import Vector
+
+class Blob(object):
+  def __init__(self, pos, radius, store=None, slot=-1):
+    self.store = store
+    self.slot = slot
+
+    if store is None:
+      self._id = None
+      self._pos = Vector(pos)
+      self._radius = radius
+      self._state = 0
+      self._roads = []
+
+  def isBound(self):
+    return self.store is not None
+
+  def getId(self):
+    if self.store is None:
+      return self._id
+    return int(self.store.ids[self.slot])
+  def setId(self, value):
+    if self.store is None:
+      self._id = value
+    else:
+      self.store.ids[self.slot] = value
+  id = property(getId, setId)
+
+  def getPos(self):
+    if self.store is None:
+      return self._pos
+    return Vector(float(self.store.x[self.slot]), float(self.store.y[self.slot]))
+  def setPos(self, value):
+    if self.store is None:
+      self._pos = Vector(value)
+    else:
+      self.store.x[self.slot] = value[0]
+      self.store.y[self.slot] = value[1]
+  pos = property(getPos, setPos)
+
+  def getRadius(self):
+    if self.store is None:
+      return self._radius
+    return int(self.store.radius[self.slot])
+  def setRadius(self, value):
+    if self.store is None:
+      self._radius = value
+    else:
+      self.store.radius[self.slot] = value
+  radius = property(getRadius, setRadius)
+
+  def getState(self):
+    if self.store is None:
+      return self._state
+    return int(self.store.state[self.slot])
+  def setState(self, value):
+    if self.store is None:
+      self._state = value
+    else:
+      self.store.state[self.slot] = value
+  state = property(getState, setState)
+
+  def getRoads(self):
+    if self.store is None:
+      return self._roads
+    return self.store.roads[self.slot]
+  def setRoads(self, value):
+    if self.store is None:
+      self._roads = value
+    else:
+      self.store.roads[self.slot] = value
+  roads = property(getRoads, setRoads)
+
+  def clone(self):
+    result = Blob(self.pos, self.radius)
+    result.id = self.id
+    result.state = self.state
+    result.roads = list(self.roads)
+    return result
+
+  def __getstate__(self):
+    return [self.id, self.pos, self.radius, self.state]
+
+  def __setstate__(self, stateData):
+    self.store = None
+    self.slot = -1
+    self._id = stateData[0]
+    self._pos = stateData[1]
+    self._radius = stateData[2]
+    self._state = stateData[3]
+    self._roads = []
+
+class BlobStore:
+  def __init__(self, capacity=256):
+    self.capacity = 0
+    self.x = numpy.zeros(0, dtype=numpy.float64)
+    self.y = numpy.zeros(0, dtype=numpy.float64)
+    self.radius = numpy.zeros(0, dtype=numpy.int32)
+    self.state = numpy.zeros(0, dtype=numpy.int32)
+    self.ids = numpy.zeros(0, dtype=numpy.int64)
+    self.alive = numpy.zeros(0, dtype=numpy.bool_)
+    self.roads = []
+
+    self.top = 0 # slots below top have been handed out at least once
+    self.count = 0
+    self.freeSlots = []
+    self.slots = {}
+    self.nextId = 1
+
+    self.grow(capacity)
+
+  def grow(self, capacity):
+    if capacity <= self.capacity:
+      return
+
+    for name in ['x', 'y', 'radius', 'state', 'ids', 'alive']:
+      old = getattr(self, name)
+      new = numpy.zeros(capacity, dtype=old.dtype)
+      new[:self.capacity] = old
+      setattr(self, name, new)
+    self.ids[self.capacity:] = -1
+    self.roads.extend([None] * (capacity - self.capacity))
+    self.capacity = capacity
+
+  def add(self, x, y, radius, state=0, id=None):
+    if id is None:
+      id = self.nextId
+    self.nextId = max(self.nextId, id + 1)
+
+    if len(self.freeSlots) > 0:
+      slot = self.freeSlots.pop()
+    else:
+      if self.top >= self.capacity:
+        self.grow(max(self.capacity * 2, 16))
+      slot = self.top
+      self.top += 1
+
+    self.x[slot] = x
+    self.y[slot] = y
+    self.radius[slot] = radius
+    self.state[slot] = state
+    self.ids[slot] = id
+    self.alive[slot] = True
+    self.roads[slot] = []
+    self.slots[id] = slot
+    self.count += 1
+
+    return slot
+
+  def remove(self, slot):
+    if not self.alive[slot]:
+      return
+
+    self.slots.pop(int(self.ids[slot]), None)
+    self.alive[slot] = False
+    self.ids[slot] = -1
+    self.roads[slot] = None
+    self.freeSlots.append(slot)
+    self.count -= 1
+
+  def clear(self):
+    self.alive[:] = False
+    self.ids[:] = -1
+    self.roads = [None] * self.capacity
+    self.top = 0
+    self.count = 0
+    self.freeSlots = []
+    self.slots = {}
+
+  def snapshot(self):
+    slots = self.activeSlots()
+    return {
+      "nextId": self.nextId,
+      "ids": self.ids[slots],
+      "x": self.x[slots],
+      "y": self.y[slots],
+      "radius": self.radius[slots],
+      "state": self.state[slots]
+    }
+
+  def load(self, snapshot):
+    self.clear()
+
+    count = len(snapshot["ids"])
+    self.grow(count)
+    self.ids[:count] = snapshot["ids"]
+    self.x[:count] = snapshot["x"]
+    self.y[:count] = snapshot["y"]
+    self.radius[:count] = snapshot["radius"]
+    self.state[:count] = snapshot["state"]
+    self.alive[:count] = True
+    self.roads[:count] = [[] for i in range(count)]
+
+    self.top = count
+    self.count = count
+    self.slots = dict(zip(self.ids[:count].tolist(), range(count)))
+    self.nextId = max(self.nextId, snapshot["nextId"], int(self.ids[:count].max()) + 1 if count > 0 else 1)
+
+  def activeSlots(self):
+    return numpy.flatnonzero(self.alive[:self.top])
+
+  def slotOf(self, id):
+    return self.slots.get(id, -1)
+
+  def view(self, slot):
+    return Blob(None, None, self, slot)
+
+  def views(self, slots=None):
+    if slots is None:
+      slots = self.activeSlots()
+    return [Blob(None, None, self, slot) for slot in numpy.asarray(slots).tolist()]
+
+  # id -> Blob mapping, so the store can stand in for the old blobDict
+  def has_key(self, id):
+    return self.slots.has_key(id)
+
+  def __contains__(self, id):
+    return self.slots.has_key(id)
+
+  def __getitem__(self, id):
+    return self.view(self.slots[id])
+
+  def get(self, id, default=None):
+    slot = self.slots.get(id)
+    if slot is None:
+      return default
+    return self.view(slot)
+
+  def __len__(self):
+    return self.count
@@ -0,0 +1,239 @@
+# -*- coding: utf8 -*-
+
+import multiprocessing, signal, ctypes, numpy
+from multiprocessing.sharedctypes import RawArray
+from blobgrowth import BlobGrowth
+from occupancy import OccupancyGrid
+
+# name, ctype, numpy dtype of every shared column; blob columns are indexed by
+# store slot, the grow* columns hold what the workers decided for their blobs
+blobColumns = [
+  ("x", ctypes.c_double, numpy.float64),
+  ("y", ctypes.c_double, numpy.float64),
+  ("radius", ctypes.c_int32, numpy.int32),
+  ("alive", ctypes.c_bool, numpy.bool_),
+  ("growX", ctypes.c_double, numpy.float64),
+  ("growY", ctypes.c_double, numpy.float64),
+  ("growR", ctypes.c_int32, numpy.int32),
+  ("grown", ctypes.c_bool, numpy.bool_)
+]
+
+def expandRanges(starts, counts):
+  # starts[i], starts[i] + 1, ... counts[i] times for every i, concatenated
+  total = int(counts.sum())
+  return numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + numpy.repeat(starts, counts)
+
+def sharedViews(buffers, capacity, mapShape):
+  views = {}
+  for name, ctype, dtype in blobColumns:
+    views[name] = numpy.frombuffer(buffers[name], dtype=dtype)
+  views["cells"] = numpy.frombuffer(buffers["cells"], dtype=numpy.bool_).reshape(mapShape)
+  views["integral"] = numpy.frombuffer(buffers["integral"], dtype=numpy.int32).reshape((mapShape[0] + 1, mapShape[1] + 1))
+  return views
+
+class CellIndex:
+  # the blobs around one tile bucketed like SpatialHash, queried for many positions at once
+  def __init__(self, xs, ys, items, cellSize=32):
+    self.cellSize = float(cellSize)
+    keys = self.getKeys(xs, ys)
+    order = numpy.argsort(keys, kind="mergesort")
+    self.keys = keys[order]
+    self.items = numpy.asarray(items)[order]
+
+  def getCells(self, values):
+    return numpy.floor(numpy.asarray(values, dtype=numpy.float64) / self.cellSize).astype(numpy.int64)
+
+  def getKeys(self, xs, ys, cellsX=None, cellsY=None):
+    if cellsX is None:
+      cellsX = self.getCells(xs)
+      cellsY = self.getCells(ys)
+    return cellsX * 65536 + cellsY
+
+  def queryMany(self, xs, ys, radii):
+    # every cell the square around a position touches, then every item in those cells
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    radii = numpy.asarray(radii, dtype=numpy.float64)
+    minX = self.getCells(xs - radii)
+    minY = self.getCells(ys - radii)
+    spanX = self.getCells(xs + radii) - minX + 1
+    spanY = self.getCells(ys + radii) - minY + 1
+
+    cellCount = spanX * spanY
+    query = numpy.repeat(numpy.arange(len(xs)), cellCount)
+    cell = expandRanges(numpy.zeros(len(xs), dtype=numpy.int64), cellCount)
+    keys = self.getKeys(None, None, minX[query] + cell // spanY[query], minY[query] + cell % spanY[query])
+
+    start = numpy.searchsorted(self.keys, keys, side="left")
+    count = numpy.searchsorted(self.keys, keys, side="right") - start
+    return numpy.repeat(query, count), self.items[expandRanges(start, count)]
+
+class TileWorker:
+  # stands in for the blob manager and its store inside a worker process
+  def __init__(self, buffers, capacity, mapShape):
+    self.capacity = capacity
+    views = sharedViews(buffers, capacity, mapShape)
+    for name, ctype, dtype in blobColumns:
+      setattr(self, name, views[name])
+    self.occupancy = OccupancyGrid(None, cells=views["cells"], integral=views["integral"])
+
+    self.store = self
+    self.blobIndex = None
+    self.maxBlobRadius = 0
+    self.owned = None
+
+  def activeSlots(self):
+    return self.owned
+
+  def run(self, bounds, halo, seed, top, maxBlobRadius, dirtyTiles, mergeLimit, mergeRadiusFactor):
+    x0, y0, x1, y1 = bounds
+    x = self.x[:top]
+    y = self.y[:top]
+    near = numpy.flatnonzero(self.alive[:top] & (x >= x0 - halo) & (x < x1 + halo) & (y >= y0 - halo) & (y < y1 + halo))
+    owned = near[(x[near] >= x0) & (x[near] < x1) & (y[near] >= y0) & (y[near] < y1)]
+    self.owned = owned
+    self.maxBlobRadius = maxBlobRadius
+    self.blobIndex = CellIndex(x[near], y[near], near)
+    growth = BlobGrowth(self, seed)
+
+    dead = owned[:0]
+    if dirtyTiles is not None and len(owned) > 0:
+      dead = growth.findInvalid(dirtyTiles)
+    slots = numpy.setdiff1d(owned, dead)
+    if len(slots) == 0:
+      return slots, dead, slots, slots, slots, slots
+
+    accepted, newX, newY, newR, first, second = growth.propose(slots)
+    self.growX[slots] = newX
+    self.growY[slots] = newY
+    self.growR[slots] = newR
+    self.grown[slots] = accepted
+
+    # neighbours owned by another tile are settled in the reconcile pass
+    foreign = accepted[first] & ~numpy.in1d(second, slots)
+    failed = slots[~accepted]
+    mergeSlots, mergeOthers = growth.findMerges(failed[self.radius[failed] < mergeLimit], mergeRadiusFactor)
+
+    return slots, dead, slots[first[foreign]], second[foreign], mergeSlots, mergeOthers
+
+worker = None
+
+def initWorker(buffers, capacity, mapShape):
+  global worker
+  signal.signal(signal.SIGINT, signal.SIG_IGN) # ctrl-c is handled by the main process
+  worker = TileWorker(buffers, capacity, mapShape)
+
+def runTile(task):
+  return worker.run(*task)
+
+class TiledGrowth:
+  # grows, merges and validates the blobs of every tile in a worker process;
+  # each tile sees its neighbours within a halo, so only pairs across tiles
+  # are left for the reconcile pass
+  def __init__(self, blobManager, workers=None, tileSize=256):
+    self.blobManager = blobManager
+    self.workers = workers or multiprocessing.cpu_count()
+    self.tileSize = tileSize
+
+    self.pool = None
+    self.capacity = 0
+    self.mapShape = None
+    self.occupancy = None
+    self.views = None
+
+  def start(self, capacity, mapShape):
+    self.close()
+
+    buffers = {}
+    for name, ctype, dtype in blobColumns:
+      buffers[name] = RawArray(ctype, capacity)
+    buffers["cells"] = RawArray(ctypes.c_bool, mapShape[0] * mapShape[1])
+    buffers["integral"] = RawArray(ctypes.c_int32, (mapShape[0] + 1) * (mapShape[1] + 1))
+
+    self.views = sharedViews(buffers, capacity, mapShape)
+    self.capacity = capacity
+    self.mapShape = mapShape
+    self.occupancy = None
+    self.pool = multiprocessing.Pool(self.workers, initWorker, (buffers, capacity, mapShape))
+
+  def sync(self):
+    store = self.blobManager.store
+    occupancy = self.blobManager.occupancy
+    if self.pool is None or store.capacity > self.capacity or occupancy.cells.shape != self.mapShape:
+      self.start(max(store.capacity, self.capacity * 2), occupancy.cells.shape)
+
+    views = self.views
+    if occupancy is not self.occupancy:
+      views["cells"][:] = occupancy.cells
+      views["integral"][:] = occupancy.integral
+      self.occupancy = occupancy
+
+    count = store.capacity
+    views["x"][:count] = store.x
+    views["y"][:count] = store.y
+    views["radius"][:count] = store.radius
+    views["alive"][:count] = store.alive
+    views["alive"][count:] = False
+    views["grown"][:] = False
+
+  def tiles(self):
+    # the outer tiles also own whatever lies beyond the map border
+    width, height = self.mapShape
+    tileSize = self.tileSize
+    edgesX = [float(x) for x in range(0, width, tileSize)][1:]
+    edgesY = [float(y) for y in range(0, height, tileSize)][1:]
+    edgesX = [-float("inf")] + edgesX + [float("inf")]
+    edgesY = [-float("inf")] + edgesY + [float("inf")]
+    return [(edgesX[i], edgesY[j], edgesX[i + 1], edgesY[j + 1]) for i in range(len(edgesX) - 1) for j in range(len(edgesY) - 1)]
+
+  def step(self, dirtyTiles=None):
+    # returns the moved and failed slots, ids of blobs that died and id pairs to merge
+    blobManager = self.blobManager
+    store = blobManager.store
+    self.sync()
+
+    # far enough out to hold every blob a candidate, a merged blob or a
+    # merge partner of an owned blob could touch; growth queries reach past
+    # its own jitter by the largest jitter of any blob as well
+    growth = blobManager.growth
+    maxBlobRadius = blobManager.maxBlobRadius
+    steps = growth.jitterSteps
+    mergeReach = int(blobManager.blobMergeLimit * (blobManager.blobMergeRadiusFactor / 2.0 + 1)) + 1
+    halo = 2 * maxBlobRadius + max(steps * (steps - 1) + 3, mergeReach)
+
+    tiles = self.tiles()
+    seeds = growth.random.randint(2 ** 31 - 1, size=len(tiles)).tolist()
+    tasks = [(bounds, halo, seed, store.top, maxBlobRadius, dirtyTiles, blobManager.blobMergeLimit,
+      blobManager.blobMergeRadiusFactor) for bounds, seed in zip(tiles, seeds)]
+    results = self.pool.map(runTile, tasks)
+
+    slots, dead, crossFirst, crossSecond, mergeSlots, mergeOthers = [numpy.concatenate(column).astype(numpy.intp) for column in zip(*results)]
+
+    # reconcile: accepted neighbours on different tiles that overlap now,
+    # the later slot keeps its old state just like within a tile
+    views = self.views
+    grown = views["grown"]
+    a = numpy.minimum(crossFirst, crossSecond)
+    b = numpy.maximum(crossFirst, crossSecond)
+    both = grown[a] & grown[b]
+    a = a[both]
+    b = b[both]
+    dx = views["growX"][a] - views["growX"][b]
+    dy = views["growY"][a] - views["growY"][b]
+    reach = views["growR"][a] + views["growR"][b]
+    grown[b[(dx * dx + dy * dy) < reach * reach]] = False
+
+    accepted = grown[slots]
+    movedSlots = slots[accepted]
+    store.x[movedSlots] = views["growX"][movedSlots]
+    store.y[movedSlots] = views["growY"][movedSlots]
+    store.radius[movedSlots] = views["growR"][movedSlots]
+
+    merges = zip(store.ids[mergeSlots].tolist(), store.ids[mergeOthers].tolist())
+    return movedSlots, slots[~accepted], store.ids[dead].tolist(), merges
+
+  def close(self):
+    if self.pool:
+      self.pool.terminate()
+      self.pool.join()
+      self.pool = None
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+import mmap, struct, time, numpy
+from depthring import DepthRing
+
+# header: magic, version, reserved, width, height
+# frames: seconds since the first frame followed by width * height mask bytes
+captureMagic = "CSCP"
+captureVersion = 1
+captureHeader = struct.Struct("<4sHHII")
+frameHeader = struct.Struct("<d")
+
+class CaptureWriter:
+  def __init__(self, filename, width, height):
+    self.width = width
+    self.height = height
+    self.startTime = None
+    self.file = open(filename, 'wb')
+    self.file.write(captureHeader.pack(captureMagic, captureVersion, 0, width, height))
+
+  def write(self, timestamp, mask):
+    if self.startTime is None:
+      self.startTime = timestamp
+    self.file.write(frameHeader.pack(timestamp - self.startTime))
+    self.file.write(numpy.ascontiguousarray(mask, dtype=numpy.uint8).tostring())
+
+  def close(self):
+    self.file.close()
+
+class CaptureReader:
+  def __init__(self, filename):
+    self.file = open(filename, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, reserved, self.width, self.height = captureHeader.unpack_from(self.map, 0)
+    if magic != captureMagic or version != captureVersion:
+      self.close()
+      raise ValueError("unsupported capture " + filename)
+
+    self.frameSize = self.width * self.height
+    self.recordSize = frameHeader.size + self.frameSize
+    self.frameCount = (len(self.map) - captureHeader.size) // self.recordSize
+
+  def frameTime(self, index):
+    return frameHeader.unpack_from(self.map, captureHeader.size + index * self.recordSize)[0]
+
+  def frame(self, index):
+    start = captureHeader.size + index * self.recordSize + frameHeader.size
+    mask = numpy.frombuffer(self.map[start:start + self.frameSize], dtype=numpy.uint8)
+    return mask.reshape(self.height, self.width)
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+def record(ringFilename, captureFilename, seconds):
+  ring = DepthRing(ringFilename)
+  writer = CaptureWriter(captureFilename, ring.width, ring.height)
+
+  print "recording", ringFilename, "to", captureFilename
+  lastFrame = 0
+  frames = 0
+  endTime = time.time() + seconds
+  while time.time() < endTime:
+    frame = ring.read(lastFrame)
+    if frame is None:
+      time.sleep(0.002)
+      continue
+
+    lastFrame, mask = frame
+    writer.write(time.time(), mask)
+    frames += 1
+
+  writer.close()
+  ring.close()
+  print "done,", frames, "frames."
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="record a depth ring into a capture file for offline replay")
+  parser.add_argument("ring", help="ring file written by Protonect -s or depthring.py")
+  parser.add_argument("capture", help="capture file to write")
+  parser.add_argument("--seconds", type=float, default=60.0)
+  args = parser.parse_args()
+
+  record(args.ring, args.capture, args.seconds)
@@ -0,0 +1,98 @@
+# -*- coding: utf8 -*-
+
+import sys, time
+
+class LogLevel:
+  Debug = 10
+  Info = 20
+  Warning = 30
+  Error = 40
+  Off = 100
+
+levelNames = {
+  LogLevel.Debug: "debug",
+  LogLevel.Info: "info",
+  LogLevel.Warning: "warning",
+  LogLevel.Error: "error"
+}
+
+def ignore(*args):
+  pass
+
+class Logger:
+  def __init__(self, level=LogLevel.Info, rateLimit=10, summaryInterval=1.0, stream=None):
+    self.stream = stream or sys.stdout
+    self.rateLimit = rateLimit # lines per message type and summary interval
+    self.summaryInterval = summaryInterval
+
+    self.totals = {} # message type -> count over the whole run
+    self.counters = {} # message type -> count since the last summary
+    self.written = {} # message type -> lines written since the last summary
+    self.suppressed = 0
+    self.windowStart = time.time()
+
+    self.setLevel(level)
+
+  def setLevel(self, level):
+    # disabled levels are bound to a no-op, so their messages are never formatted
+    self.level = level
+    self.debug = self.logDebug if level <= LogLevel.Debug else ignore
+    self.info = self.logInfo if level <= LogLevel.Info else ignore
+    self.warning = self.logWarning if level <= LogLevel.Warning else ignore
+    self.error = self.logError if level <= LogLevel.Error else ignore
+
+  def isEnabled(self, level):
+    # for guarding messages whose arguments cost something to build
+    return level >= self.level
+
+  def logDebug(self, messageType, message, *args):
+    self.write(LogLevel.Debug, messageType, message, args)
+
+  def logInfo(self, messageType, message, *args):
+    self.write(LogLevel.Info, messageType, message, args)
+
+  def logWarning(self, messageType, message, *args):
+    self.write(LogLevel.Warning, messageType, message, args)
+
+  def logError(self, messageType, message, *args):
+    self.write(LogLevel.Error, messageType, message, args)
+
+  def count(self, messageType, n=1):
+    self.counters[messageType] = self.counters.get(messageType, 0) + n
+    self.totals[messageType] = self.totals.get(messageType, 0) + n
+
+  def write(self, level, messageType, message, args):
+    self.rollWindow(time.time())
+
+    written = self.written.get(messageType, 0)
+    if written >= self.rateLimit and level < LogLevel.Error:
+      self.suppressed += 1
+      return
+    self.written[messageType] = written + 1
+
+    if args:
+      message = message % args
+    self.stream.write("%s %s: %s\n" % (levelNames[level], messageType, message))
+
+  def summary(self):
+    parts = ["%s %d" % (messageType, self.counters[messageType]) for messageType in sorted(self.counters)]
+    if self.suppressed:
+      parts.append("%d lines suppressed" % self.suppressed)
+    return ", ".join(parts)
+
+  def rollWindow(self, now):
+    if self.windowStart + self.summaryInterval > now:
+      return
+
+    if self.level <= LogLevel.Info and (self.counters or self.suppressed):
+      self.stream.write("info summary: %s\n" % self.summary())
+
+    self.windowStart = now
+    self.counters = {}
+    self.written = {}
+    self.suppressed = 0
+
+  def tick(self):
+    self.rollWindow(time.time())
+
+log = Logger()
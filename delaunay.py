@@ -0,0 +1,134 @@
+# -*- coding: utf8 -*-
+
+import numpy
+
+class Triangulation:
+  # incremental bowyer-watson over points inside the given bounds
+  def __init__(self, bounds, capacity=256):
+    self.x = []
+    self.y = []
+
+    self.capacity = 0
+    self.count = 0
+    self.a = numpy.zeros(0, dtype=numpy.intp)
+    self.b = numpy.zeros(0, dtype=numpy.intp)
+    self.c = numpy.zeros(0, dtype=numpy.intp)
+    self.cx = numpy.zeros(0, dtype=numpy.float64)
+    self.cy = numpy.zeros(0, dtype=numpy.float64)
+    self.r2 = numpy.zeros(0, dtype=numpy.float64)
+    self.alive = numpy.zeros(0, dtype=numpy.bool_)
+    self.grow(capacity)
+
+    # a super triangle far outside the bounds, its corners are the first three vertices
+    size = 100.0 * max(bounds[0], bounds[1], 1)
+    centerX = bounds[0] / 2.0
+    centerY = bounds[1] / 2.0
+    self.x.extend([centerX - size, centerX + size, centerX])
+    self.y.extend([centerY - size, centerY - size, centerY + size])
+    self.addTriangles(numpy.array([0]), numpy.array([1]), numpy.array([2]))
+    self.pointCount = 0
+
+  def grow(self, capacity):
+    if capacity <= self.capacity:
+      return
+
+    for name in ['a', 'b', 'c', 'cx', 'cy', 'r2', 'alive']:
+      old = getattr(self, name)
+      new = numpy.zeros(capacity, dtype=old.dtype)
+      new[:self.capacity] = old
+      setattr(self, name, new)
+    self.capacity = capacity
+
+  def compact(self):
+    alive = numpy.flatnonzero(self.alive[:self.count])
+    count = len(alive)
+    for name in ['a', 'b', 'c', 'cx', 'cy', 'r2']:
+      column = getattr(self, name)
+      column[:count] = column[alive]
+    self.alive[:count] = True
+    self.alive[count:] = False
+    self.count = count
+
+  def coordinates(self, vertices):
+    vertices = vertices.tolist()
+    return numpy.array([self.x[i] for i in vertices]), numpy.array([self.y[i] for i in vertices])
+
+  def addTriangles(self, a, b, c):
+    count = len(a)
+    if self.count + count > self.capacity:
+      if self.count > 2 * int(self.alive[:self.count].sum()):
+        self.compact()
+      self.grow(max(self.capacity * 2, self.count + count))
+
+    ax, ay = self.coordinates(a)
+    bx, by = self.coordinates(b)
+    cx, cy = self.coordinates(c)
+    d = 2.0 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    d[d == 0] = 1e-12 # collinear, the huge circle gets replaced by the next insert
+    aa = ax * ax + ay * ay
+    bb = bx * bx + by * by
+    cc = cx * cx + cy * cy
+    ux = (aa * (by - cy) + bb * (cy - ay) + cc * (ay - by)) / d
+    uy = (aa * (cx - bx) + bb * (ax - cx) + cc * (bx - ax)) / d
+
+    new = slice(self.count, self.count + count)
+    self.a[new] = a
+    self.b[new] = b
+    self.c[new] = c
+    self.cx[new] = ux
+    self.cy[new] = uy
+    self.r2[new] = (ax - ux) ** 2 + (ay - uy) ** 2
+    self.alive[new] = True
+    self.count += count
+
+  def insert(self, x, y):
+    count = self.count
+    inside = (self.cx[:count] - x) ** 2 + (self.cy[:count] - y) ** 2 < self.r2[:count]
+    bad = numpy.flatnonzero(inside & self.alive[:count])
+    if len(bad) == 0:
+      return -1 # duplicate of an existing point
+
+    # the cavity border is made of the edges that only one bad triangle has
+    counts = {}
+    for a, b, c in zip(self.a[bad].tolist(), self.b[bad].tolist(), self.c[bad].tolist()):
+      for edge in [(a, b) if a < b else (b, a), (b, c) if b < c else (c, b), (c, a) if c < a else (a, c)]:
+        counts[edge] = counts.get(edge, 0) + 1
+    border = numpy.array([edge for edge, n in counts.iteritems() if n == 1], dtype=numpy.intp)
+
+    vertex = len(self.x)
+    self.x.append(x)
+    self.y.append(y)
+    self.alive[bad] = False
+    self.addTriangles(border[:, 0], border[:, 1], numpy.full(len(border), vertex, dtype=numpy.intp))
+    self.pointCount += 1
+
+    return vertex - 3
+
+  def triangles(self):
+    # (n, 3) point indices, triangles touching the super triangle left out
+    alive = numpy.flatnonzero(self.alive[:self.count])
+    result = numpy.column_stack([self.a[alive], self.b[alive], self.c[alive]])
+    return result[(result >= 3).all(axis=1)] - 3
+
+  def gabrielEdges(self):
+    # delaunay edges whose opposite angles are acute on both sides, as (n, 2) point indices
+    triangles = self.triangles()
+    if len(triangles) == 0:
+      return numpy.zeros((0, 2), dtype=numpy.intp)
+
+    x = numpy.array(self.x[3:])
+    y = numpy.array(self.y[3:])
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    first = numpy.concatenate([a, b, c])
+    second = numpy.concatenate([b, c, a])
+    opposite = numpy.concatenate([c, a, b])
+
+    acute = (x[first] - x[opposite]) * (x[second] - x[opposite]) + (y[first] - y[opposite]) * (y[second] - y[opposite]) > 0
+    edges = numpy.column_stack([first, second])
+    edges.sort(axis=1)
+
+    # an edge is dropped as soon as one of its triangles sees it at an obtuse angle
+    edges, inverse = numpy.unique(edges, axis=0, return_inverse=True)
+    blocked = numpy.zeros(len(edges), dtype=numpy.bool_)
+    blocked[inverse[~acute]] = True
+    return edges[~blocked]
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+import os, sys, mmap, struct, time, glob, numpy
+
+# shared with Protonect.cpp, all fields little endian:
+#   header: magic, version, reserved, slot count, width, height, threshold, latest frame
+#   slots:  frame counter followed by width * height bytes of mask, padded to 8 bytes
+# the writer zeroes a slot's counter, fills the mask, stores the counter and
+# then publishes it as the latest frame; a reader copies the mask and checks
+# the counter again to detect a slot that was overwritten meanwhile
+ringMagic = "CSDR"
+ringVersion = 1
+ringHeader = struct.Struct("<4sHHIIIfQ")
+ringLatestOffset = 24
+slotHeader = struct.Struct("<Q")
+
+def slotSize(width, height):
+  return slotHeader.size + (width * height + 7) // 8 * 8
+
+def createRing(filename, width, height, slotCount=3, threshold=-1.0):
+  size = ringHeader.size + slotCount * slotSize(width, height)
+  with open(filename, 'wb') as f:
+    f.write(ringHeader.pack(ringMagic, ringVersion, 0, slotCount, width, height, threshold, 0))
+    f.truncate(size)
+
+class DepthRing:
+  def __init__(self, filename):
+    self.file = open(filename, 'r+b')
+    self.map = mmap.mmap(self.file.fileno(), 0)
+
+    magic, version, reserved, self.slotCount, self.width, self.height, self.threshold, latest = ringHeader.unpack_from(self.map, 0)
+    if magic != ringMagic or version != ringVersion:
+      self.close()
+      raise ValueError("unsupported depth ring " + filename)
+
+    self.frameSize = self.width * self.height
+    self.slotSize = slotSize(self.width, self.height)
+
+  def slotOffset(self, frame):
+    return ringHeader.size + (frame % self.slotCount) * self.slotSize
+
+  def latestFrame(self):
+    return slotHeader.unpack_from(self.map, ringLatestOffset)[0]
+
+  def read(self, lastFrame=0):
+    frame = self.latestFrame()
+    if frame == 0 or frame == lastFrame:
+      return None
+
+    offset = self.slotOffset(frame)
+    if slotHeader.unpack_from(self.map, offset)[0] != frame:
+      return None
+
+    start = offset + slotHeader.size
+    mask = numpy.frombuffer(self.map[start:start + self.frameSize], dtype=numpy.uint8)
+
+    if slotHeader.unpack_from(self.map, offset)[0] != frame:
+      return None # overwritten while copying
+
+    return frame, mask.reshape(self.height, self.width)
+
+  def write(self, mask):
+    frame = self.latestFrame() + 1
+    offset = self.slotOffset(frame)
+    start = offset + slotHeader.size
+
+    slotHeader.pack_into(self.map, offset, 0)
+    self.map[start:start + self.frameSize] = numpy.ascontiguousarray(mask, dtype=numpy.uint8).tostring()
+    slotHeader.pack_into(self.map, offset, frame)
+    slotHeader.pack_into(self.map, ringLatestOffset, frame)
+    return frame
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+def produce(filename, images, fps, threshold, loop):
+  # stand-in for Protonect: plays image files into the ring
+  import pygame
+
+  masks = []
+  for image in images:
+    pixels = pygame.surfarray.array3d(pygame.image.load(image))
+    masks.append((pixels.sum(axis=2) / 3).astype(numpy.uint8).T)
+
+  height, width = masks[0].shape
+  if not os.path.isfile(filename):
+    createRing(filename, width, height, threshold=threshold)
+  ring = DepthRing(filename)
+  if ring.width != width or ring.height != height:
+    ring.close()
+    createRing(filename, width, height, threshold=threshold)
+    ring = DepthRing(filename)
+
+  print "producing", len(masks), "frames of", width, "x", height, "into", filename
+  while True:
+    for mask in masks:
+      if mask.shape != (height, width):
+        print "skipping frame with a different size"
+        continue
+      ring.write(mask)
+      time.sleep(1.0 / fps)
+
+    if not loop:
+      break
+
+  ring.close()
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="write image files into a depth ring, standing in for Protonect")
+  parser.add_argument("ring", help="ring file shared with the simulator")
+  parser.add_argument("images", nargs="+", help="mask images, glob patterns are expanded")
+  parser.add_argument("--fps", type=float, default=30.0)
+  parser.add_argument("--threshold", type=float, default=-1.0)
+  parser.add_argument("--once", action="store_true", help="play the images once instead of looping")
+  args = parser.parse_args()
+
+  images = []
+  for pattern in args.images:
+    images.extend(sorted(glob.glob(pattern)) or [pattern])
+
+  produce(args.ring, images, args.fps, args.threshold, not args.once)
@@ -6,50 +6,87 @@ from os import path
 
 from blobmanager import BlobManager
 from roadmanager import RoadManager
+from roadbuilder import RoadBuilder
 from simulator import Simulator
+from mapsource import createMapSource
+from simclock import PygameClock
+from profiler import Profiler
+from renderer import LayeredRenderer
+from scheduler import Scheduler
+from citylog import log, LogLevel
 
 class Main:
 
-  def __init__(self):
+  def __init__(self, mapSource=None, mapRate=1.0, profileFile=None, workers=0):
     pygame.init()
 
     self.screenDim = (1024, 786)
     self.screen = pygame.display.set_mode(self.screenDim)
     self.background = (255, 255, 255)
     self.running = False
+    self.clock = PygameClock()
+    self.profiler = Profiler(exportFile=profileFile)
+    self.renderer = LayeredRenderer(self.screen)
 
-    self.scoreCheckInterval = 10000
-    self.lastScoreCheck = 0
+    self.frameRate = 40
     self.currentBlobManagerScore = 0
 
     self.mapData = None
+    self.mapVersion = 0
+    self.occupancy = None
+    self.threshold = 600
     #self.mapDataPath = "data/test_"
     self.mapDataPath = "map.png"
 
     self.updateBlobs = True
 
-    self.blobManager = BlobManager(self.screenDim, self.mapData)
+    self.blobManager = BlobManager(self.screenDim, self.occupancy, self.clock)
+    if workers:
+      self.blobManager.enableTiles(workers)
     self.roadManager = RoadManager(self.screenDim, self.blobManager)
-    self.simulator = Simulator(self.blobManager, self.roadManager)
-
-    self.mapReloadInterval = 1000
-    self.lastMapReload = 0
+    self.roadBuilder = RoadBuilder(self.roadManager)
+    self.simulator = Simulator(self.blobManager, self.roadManager, self.clock)
+
+    # a depth ring written by Protonect -s takes over from the png handoff
+    self.depthRingPath = "depth.ring"
+    if isinstance(mapSource, basestring):
+      self.mapSource = createMapSource(mapSource, self.screenDim, self.threshold, mapRate)
+    elif mapSource:
+      self.mapSource = mapSource
+    elif path.isfile(self.depthRingPath):
+      self.mapSource = createMapSource(self.depthRingPath, self.screenDim, self.threshold)
+    else:
+      self.mapSource = createMapSource(self.mapDataPath, self.screenDim, self.threshold)
+
+    # every subsystem ticks at its own fixed rate, blob growth is skipped
+    # first when a frame runs out of time
+    self.scheduler = Scheduler(budget=15.0, profiler=self.profiler)
+    self.scheduler.add("map", self.reloadMap, 1.0)
+    self.scheduler.add("motives", self.simulator.update, 40.0)
+    self.scheduler.add("blobs", self.growBlobs, 5.0, shed=True)
+    self.scheduler.add("roads", self.maintainRoads, 10.0) # a maintenance pass every second, checks spread in between
+    self.scheduler.add("roads.validate", self.validateRoads) # on map change
+    self.scheduler.add("score", self.checkScore, 0.1)
 
     self.wasRight = False
     self.drawBackground = True
 
-  def reloadMap(self):
-    list = range(1, 11)
-    list.reverse()
-    for i in list:
-      filename = self.mapDataPath# + str(i) + ".png"
-      if path.isfile(filename):
-        #print filename
-        img = pygame.image.load(filename)
-        self.mapData = pygame.transform.scale(img, self.screenDim)
-        self.blobManager.mapData = self.mapData
-        break
-    #print "done " + str(self.mapData)
+  def reloadMap(self, dt=None):
+    if self.mapData is None:
+      self.mapSource.load() # nothing to show yet, so the first load blocks
+      self.applyMap()
+    self.mapSource.request()
+
+  def applyMap(self):
+    loaded = self.mapSource.poll()
+    if loaded:
+      self.mapData, occupancy, dirtyTiles = loaded
+      self.mapVersion += 1
+      self.occupancy = occupancy
+      self.blobManager.occupancy = occupancy
+      self.blobManager.invalidate(dirtyTiles)
+      self.roadManager.invalidate(dirtyTiles)
+      self.scheduler.trigger("roads.validate")
 
   def poll(self):
     events = pygame.event.get()
@@ -57,6 +94,7 @@ class Main:
       if e.type == pygame.QUIT:
         self.running = False
       elif e.type == pygame.KEYUP:
+        self.renderer.invalidate()
         if e.key == pygame.K_ESCAPE:
           self.running = False
         elif e.key == pygame.K_f:
@@ -71,6 +109,8 @@ class Main:
           self.blobManager.drawBlobs = not self.blobManager.drawBlobs
         elif e.key == pygame.K_u:
           self.updateBlobs = not self.updateBlobs
+        elif e.key == pygame.K_p:
+          self.profiler.toggleOverlay()
       elif e.type == pygame.MOUSEBUTTONDOWN:
           btns = pygame.mouse.get_pressed()
           self.wasRight = btns[2]
@@ -81,60 +121,86 @@ class Main:
           self.blobManager.spawnAt(e.pos)
 
   def update(self, dt):
+    self.profiler.timed("update.map", self.applyMap)
+    self.profiler.timed("roads.swap", self.roadBuilder.update)
+    self.scheduler.update(dt)
 
-    time = pygame.time.get_ticks()
-
-    if self.lastMapReload == 0 or self.lastMapReload + self.mapReloadInterval < time:
-      self.lastMapReload = time
-      #print "reloading map..."
-      self.reloadMap()
-
+  def growBlobs(self, dt):
     if self.updateBlobs:
       self.blobManager.update(dt)
 
+  def maintainRoads(self, dt):
+    if self.updateBlobs:
       self.roadManager.update(dt)
 
-    self.simulator.update(dt)
+  def validateRoads(self, dt):
+    self.roadManager.revalidateDirty()
+    self.roadManager.updateGraph()
+
+  def checkScore(self, dt):
+    newScore = self.blobManager.calculateScore()
+    if newScore > self.currentBlobManagerScore:
+      self.currentBlobManagerScore = newScore
+      log.info("score", "updating roads (score: %s)", self.currentBlobManagerScore)
+      if not self.roadBuilder.isBusy(): # the running job already sees most of the change
+        self.roadBuilder.request()
+    else:
+      log.debug("score", "no score change")
 
+  def drawStatic(self, surface):
+    if self.mapData and self.drawBackground:
+      surface.blit(self.mapData, [0,0, self.screenDim[0], self.screenDim[1]])
+    else:
+      surface.fill((0,0,0))
 
-    if self.lastScoreCheck == 0 or self.lastScoreCheck + self.scoreCheckInterval < time:
-      self.lastScoreCheck = time
-      print "calculating scores..."
-      newScore = self.blobManager.calculateScore()
-      if newScore > self.currentBlobManagerScore:
-        self.currentBlobManagerScore = newScore
-        print "updating roads (score:" + str(self.currentBlobManagerScore) + ")"
-        self.roadManager.regenerate()
-      else:
-        print "no score change"
+    self.profiler.timed("draw.blobs", self.blobManager.draw, surface)
+    self.profiler.timed("draw.roads", self.roadManager.draw, surface)
 
   def draw(self):
-    if self.mapData and self.drawBackground:
-      self.screen.blit(self.mapData, [0,0, self.screenDim[0], self.screenDim[1]])
-    else:
-      self.screen.fill((0,0,0))
+    # map, blobs and roads come from a cached layer, only motives are drawn every frame
+    key = (self.mapVersion, self.blobManager.version, self.roadManager.version)
+    self.renderer.updateStatic(key, self.clock.getTicks(), self.drawStatic)
+    self.renderer.begin()
 
-    self.blobManager.draw(self.screen)
-    self.roadManager.draw(self.screen)
-    self.simulator.draw(self.screen)
+    return self.profiler.timed("draw.motives", self.simulator.draw, self.screen)
 
   def run(self):
 
     self.running = True
     clock = pygame.time.Clock()
     while self.running:
-      dt = clock.tick(40) / 1000.0
-
-      self.screen.fill(self.background)
+      dt = clock.tick(self.frameRate) / 1000.0
+      self.profiler.timed("frame", self.frame, dt)
+      self.profiler.tick()
+      log.tick()
 
-      self.poll()
-      self.update(dt)
-      self.draw()
+  def frame(self, dt):
+    self.profiler.timed("poll", self.poll)
+    self.profiler.timed("update", self.update, dt)
+    rects = self.profiler.timed("draw", self.draw)
+    if self.profiler.showOverlay:
+      rects.append(self.profiler.draw(self.screen))
 
-      pygame.display.flip()
+    self.profiler.timed("display", self.renderer.present, rects)
 
 if __name__ == '__main__':
-  main = Main()
+  import argparse
+
+  parser = argparse.ArgumentParser(description="kinect supported augmented reality city simulator")
+  parser.add_argument("map", nargs="?", help="map image, image directory or glob, .ring live feed or .capture recording")
+  parser.add_argument("--rate", type=float, default=1.0, help="frames per second for image sequences, speed for recordings")
+  parser.add_argument("--profile", metavar="FILE", help="export frame timings to a .csv or .jsonl file, toggle the overlay with p")
+  parser.add_argument("--workers", type=int, default=0, help="grow blobs tile by tile in this many processes, for large tables")
+  parser.add_argument("--log-level", default="info", choices=["debug", "info", "warning", "error", "off"])
+  args = parser.parse_args()
+
+  log.setLevel(getattr(LogLevel, args.log_level.capitalize()))
+  main = Main(args.map, args.rate, args.profile, args.workers)
   print "starting..."
   main.run()
   print "shuting down..."
+  main.roadBuilder.close()
+  main.blobManager.persistBlobs()
+  main.blobManager.close()
+  main.mapSource.close()
+  main.profiler.close()
@@ -0,0 +1,270 @@
+# -*- coding: utf8 -*-
+
+import os, glob, threading, time, hashlib, numpy, pygame
+from StringIO import StringIO
+from occupancy import OccupancyGrid
+from depthring import DepthRing
+from capture import CaptureReader
+from citylog import log
+
+def maskToMap(mask, screenDim, threshold=600):
+  # mask is a (height, width) 8 bit image, scaled nearest neighbour to the screen
+  height, width = mask.shape
+  xs = numpy.arange(screenDim[0]) * width // screenDim[0]
+  ys = numpy.arange(screenDim[1]) * height // screenDim[1]
+  scaled = mask[ys[None, :], xs[:, None]]
+
+  # a gray pixel counts r + g + b like a map image would
+  cells = scaled.astype(numpy.int32) * 3 < threshold
+  mapData = pygame.surfarray.make_surface(numpy.repeat(scaled[:, :, None], 3, axis=2))
+  return mapData, OccupancyGrid(None, threshold, cells=cells)
+
+def imageToMap(img, screenDim, threshold=600):
+  mapData = pygame.transform.scale(img, screenDim)
+  return mapData, OccupancyGrid(mapData, threshold)
+
+# a map source produces (mapData, occupancy, dirtyTiles) for the main loop:
+# load() fetches a new map if there is one and publishes it, request() asks
+# the worker thread to do that in the background and poll() hands out the
+# newest published map, if any, exactly once. subclasses implement fetch(),
+# load() keeps the main loop and the worker from fetching at the same time
+class MapSource:
+  def __init__(self, screenDim, threshold=600):
+    self.screenDim = screenDim
+    self.threshold = threshold
+    self.occupancy = None
+
+    # the worker fills the back buffer, poll() swaps it out on the main loop
+    self.ready = None
+    self.lock = threading.Lock()
+    self.loadLock = threading.Lock() # publish compares against the previous occupancy
+    self.wakeup = threading.Event()
+    self.thread = None
+    self.running = False
+
+  def start(self):
+    if self.thread is None:
+      self.running = True
+      self.thread = threading.Thread(target=self.run, name=self.__class__.__name__)
+      self.thread.daemon = True
+      self.thread.start()
+
+  def request(self):
+    self.start()
+    self.wakeup.set()
+
+  def run(self):
+    while self.running:
+      self.wakeup.wait()
+      self.wakeup.clear()
+      if self.running:
+        self.load()
+
+  def load(self):
+    with self.loadLock:
+      return self.fetch()
+
+  def fetch(self):
+    return False
+
+  def publish(self, mapData, occupancy):
+    dirtyTiles = occupancy.changedTiles(self.occupancy)
+    self.occupancy = occupancy
+
+    with self.lock:
+      if self.ready is not None:
+        dirtyTiles = self.ready[2].merge(dirtyTiles) # the skipped map changed tiles too
+      self.ready = (mapData, occupancy, dirtyTiles)
+
+  def poll(self):
+    with self.lock:
+      result = self.ready
+      self.ready = None
+    return result
+
+  def close(self):
+    self.running = False
+    self.wakeup.set()
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+class StaticImageMapSource(MapSource):
+  def __init__(self, filename, screenDim, threshold=600):
+    MapSource.__init__(self, screenDim, threshold)
+    self.filename = filename
+
+    self.signature = None
+    self.digest = None
+
+  def fetch(self):
+    try:
+      stat = os.stat(self.filename)
+    except OSError:
+      return False
+
+    signature = (stat.st_mtime, stat.st_size)
+    if signature == self.signature:
+      return False
+
+    with open(self.filename, 'rb') as f:
+      data = f.read()
+    digest = hashlib.md5(data).digest()
+    if digest == self.digest:
+      self.signature = signature
+      return False
+
+    try:
+      img = pygame.image.load(StringIO(data), self.filename)
+    except pygame.error as e:
+      log.warning("map", "map decode failed: %s", e) # probably caught mid write, retried next time
+      return False
+
+    self.signature = signature
+    self.digest = digest
+    self.publish(*imageToMap(img, self.screenDim, self.threshold))
+
+    return True
+
+class PlaybackMapSource(MapSource):
+  def __init__(self, screenDim, threshold=600, speed=1.0, loop=True):
+    MapSource.__init__(self, screenDim, threshold)
+    self.speed = speed
+    self.loop = loop
+    self.clock = time.time
+    self.pollInterval = 0.005
+
+    self.index = 0
+    self.startTime = None
+
+  def frameCount(self):
+    return 0
+
+  def frameTime(self, index):
+    return 0.0
+
+  def loadFrame(self, index):
+    return None
+
+  def request(self):
+    self.start() # the worker plays the frames on its own
+
+  def run(self):
+    while self.running:
+      if not self.load():
+        time.sleep(self.pollInterval)
+
+  def isDue(self, index, now):
+    return (now - self.startTime) * self.speed >= self.frameTime(index)
+
+  def fetch(self):
+    count = self.frameCount()
+    if count == 0:
+      return False
+
+    now = self.clock()
+    if self.index >= count:
+      if not self.loop:
+        return False
+      self.index = 0
+      self.startTime = None
+
+    if self.startTime is None:
+      self.startTime = now - self.frameTime(self.index) / self.speed
+
+    if not self.isDue(self.index, now):
+      return False
+
+    # skip frames that are already late instead of falling behind
+    while self.index + 1 < count and self.isDue(self.index + 1, now):
+      self.index += 1
+
+    mapData, occupancy = self.loadFrame(self.index)
+    self.publish(mapData, occupancy)
+    self.index += 1
+    return True
+
+class ImageSequenceMapSource(PlaybackMapSource):
+  def __init__(self, pattern, screenDim, threshold=600, rate=1.0, loop=True):
+    PlaybackMapSource.__init__(self, screenDim, threshold, 1.0, loop)
+    if os.path.isdir(pattern):
+      pattern = os.path.join(pattern, "*.png")
+    self.filenames = sorted(glob.glob(pattern))
+    self.rate = rate
+
+  def frameCount(self):
+    return len(self.filenames)
+
+  def frameTime(self, index):
+    return index / float(self.rate)
+
+  def loadFrame(self, index):
+    return imageToMap(pygame.image.load(self.filenames[index]), self.screenDim, self.threshold)
+
+class RecordedMapSource(PlaybackMapSource):
+  def __init__(self, filename, screenDim, threshold=600, speed=1.0, loop=True):
+    PlaybackMapSource.__init__(self, screenDim, threshold, speed, loop)
+    self.reader = CaptureReader(filename)
+
+  def frameCount(self):
+    return self.reader.frameCount
+
+  def frameTime(self, index):
+    return self.reader.frameTime(index)
+
+  def loadFrame(self, index):
+    return maskToMap(self.reader.frame(index), self.screenDim, self.threshold)
+
+  def close(self):
+    PlaybackMapSource.close(self)
+    self.reader.close()
+
+class SharedMemoryMapSource(MapSource):
+  def __init__(self, filename, screenDim, threshold=600):
+    MapSource.__init__(self, screenDim, threshold)
+    self.filename = filename
+    self.ring = None
+    self.lastFrame = 0
+    self.pollInterval = 0.005
+
+  def request(self):
+    self.start() # the worker follows the ring on its own
+
+  def run(self):
+    while self.running:
+      if not self.load():
+        time.sleep(self.pollInterval)
+
+  def fetch(self):
+    if self.ring is None:
+      try:
+        self.ring = DepthRing(self.filename)
+      except (IOError, OSError, ValueError):
+        return False # producer has not created the ring yet
+
+    frame = self.ring.read(self.lastFrame)
+    if frame is None:
+      return False
+
+    self.lastFrame, mask = frame
+    mapData, occupancy = maskToMap(mask, self.screenDim, self.threshold)
+    self.publish(mapData, occupancy)
+    return True
+
+  def close(self):
+    MapSource.close(self)
+    if self.ring is not None:
+      self.ring.close()
+      self.ring = None
+
+def createMapSource(spec, screenDim, threshold=600, rate=1.0):
+  # picks the source from the spec: a .ring file is the live depth feed, a
+  # .capture file a recording, a directory or glob pattern an image sequence
+  # played at rate frames per second and anything else a single image
+  if spec.endswith(".ring"):
+    return SharedMemoryMapSource(spec, screenDim, threshold)
+  if spec.endswith(".capture"):
+    return RecordedMapSource(spec, screenDim, threshold, rate)
+  if os.path.isdir(spec) or glob.has_magic(spec):
+    return ImageSequenceMapSource(spec, screenDim, threshold, rate)
+  return StaticImageMapSource(spec, screenDim, threshold)
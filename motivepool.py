@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+
+import numpy
+
+class MotiveType:
+  Unknown = 0
+  Pedestrian = 1
+  Car = 2
+
+class MotivePool:
+  def __init__(self, capacity=256):
+    self.capacity = 0
+    self.startX = numpy.zeros(0, dtype=numpy.float64)
+    self.startY = numpy.zeros(0, dtype=numpy.float64)
+    self.x = numpy.zeros(0, dtype=numpy.float64)
+    self.y = numpy.zeros(0, dtype=numpy.float64)
+    self.targetX = numpy.zeros(0, dtype=numpy.float64)
+    self.targetY = numpy.zeros(0, dtype=numpy.float64)
+    self.targetId = numpy.zeros(0, dtype=numpy.int64)
+    self.destinationId = numpy.zeros(0, dtype=numpy.int64)
+    self.type = numpy.zeros(0, dtype=numpy.int8)
+    self.speed = numpy.zeros(0, dtype=numpy.float64)
+    self.age = numpy.zeros(0, dtype=numpy.int64)
+    self.ttl = numpy.zeros(0, dtype=numpy.float64)
+    self.width = numpy.zeros(0, dtype=numpy.int32)
+    self.height = numpy.zeros(0, dtype=numpy.int32)
+    self.alive = numpy.zeros(0, dtype=numpy.bool_)
+
+    self.top = 0 # slots below top have been handed out at least once
+    self.count = 0
+    self.freeSlots = []
+
+    self.minTargetDistance = 10
+    self.speedScale = 40.0 # speeds are pixels per step at the original 40 frames per second
+
+    self.grow(capacity)
+
+  def grow(self, capacity):
+    if capacity <= self.capacity:
+      return
+
+    for name in ['startX', 'startY', 'x', 'y', 'targetX', 'targetY', 'targetId', 'destinationId', 'type', 'speed', 'age', 'ttl', 'width', 'height', 'alive']:
+      old = getattr(self, name)
+      new = numpy.zeros(capacity, dtype=old.dtype)
+      new[:self.capacity] = old
+      setattr(self, name, new)
+    self.capacity = capacity
+
+  def allocate(self, count):
+    reused = min(count, len(self.freeSlots))
+    slots = self.freeSlots[len(self.freeSlots) - reused:]
+    del self.freeSlots[len(self.freeSlots) - reused:]
+
+    fresh = count - reused
+    if self.top + fresh > self.capacity:
+      self.grow(max(self.capacity * 2, self.top + fresh, 16))
+    slots.extend(range(self.top, self.top + fresh))
+    self.top += fresh
+
+    return numpy.array(slots, dtype=numpy.intp)
+
+  def spawn(self, startX, startY, targetX, targetY, targetId, types, age, destinationId=-1):
+    count = len(startX)
+    slots = self.allocate(count)
+
+    self.startX[slots] = startX
+    self.startY[slots] = startY
+    self.x[slots] = startX
+    self.y[slots] = startY
+    self.targetX[slots] = targetX
+    self.targetY[slots] = targetY
+    self.targetId[slots] = targetId
+    self.destinationId[slots] = destinationId
+    self.type[slots] = types
+    self.speed[slots] = numpy.random.random(count)
+    self.age[slots] = age
+    self.ttl[slots] = 15000 + 5000 * numpy.random.random(count)
+
+    # pedestrians are dots, cars get a small random footprint
+    cars = numpy.asarray(types) == MotiveType.Car
+    self.width[slots] = numpy.where(cars, (1 + numpy.random.random(count) * 2).astype(numpy.int32), 1)
+    self.height[slots] = numpy.where(cars, (1 + numpy.random.random(count) * 2).astype(numpy.int32), 1)
+
+    self.alive[slots] = True
+    self.count += count
+
+    return slots
+
+  def remove(self, slots):
+    slots = numpy.asarray(slots, dtype=numpy.intp)
+    slots = slots[self.alive[slots]]
+    self.alive[slots] = False
+    self.freeSlots.extend(slots.tolist())
+    self.count -= len(slots)
+
+  def clear(self):
+    self.alive[:] = False
+    self.top = 0
+    self.count = 0
+    self.freeSlots = []
+
+  def activeSlots(self):
+    return numpy.flatnonzero(self.alive[:self.top])
+
+  def step(self, time, dt=0.025):
+    # returns the active slots with masks of the ones that arrived or expired
+    slots = self.activeSlots()
+    count = len(slots)
+
+    dx = self.targetX[slots] - self.startX[slots]
+    dy = self.targetY[slots] - self.startY[slots]
+    length = numpy.hypot(dx, dy)
+    length[length == 0] = 1 # zero direction stays zero
+    dx /= length
+    dy /= length
+
+    # jitter forward plus a little to the left or right of the road direction
+    side = numpy.where(numpy.random.random(count) > 0.5, 1.0, -1.0)
+    forward = numpy.random.random(count) * 10
+    sideways = numpy.random.random(count) * side
+    mx = dx * forward - dy * sideways
+    my = dy * forward + dx * sideways
+    length = numpy.hypot(mx, my)
+    length[length == 0] = 1
+
+    speed = self.speed[slots] * (dt * self.speedScale)
+    x = self.x[slots] + mx / length * speed
+    y = self.y[slots] + my / length * speed
+    self.x[slots] = x
+    self.y[slots] = y
+
+    arrived = (self.targetX[slots] - x) ** 2 + (self.targetY[slots] - y) ** 2 < self.minTargetDistance
+    expired = (time - self.age[slots]) > self.ttl[slots]
+
+    return slots, arrived, expired
+
+  def __len__(self):
+    return self.count
@@ -0,0 +1,49 @@
+# -*- coding: utf8 -*-
+
+import numpy, pygame
+
+class MotiveRenderer:
+  # every motive is stamped from a prebuilt sprite, all of them in one blits call
+  def __init__(self, color=(255, 0, 0)):
+    self.color = color
+    self.colorKey = (0, 0, 0) if color != (0, 0, 0) else (255, 255, 255)
+    self.stamps = {} # (car, width, height) -> sprite, offset of the sprite to the motive position
+
+  def stamp(self, car, width, height):
+    key = (car, width, height)
+    stamp = self.stamps.get(key)
+    if stamp is None:
+      if car:
+        sprite = pygame.Surface((width, height))
+        sprite.fill(self.color)
+        stamp = (sprite, 0)
+      else:
+        # same circle pygame.draw.circle would put at the motive position
+        size = 2 * width + 1
+        sprite = pygame.Surface((size, size))
+        sprite.fill(self.colorKey)
+        sprite.set_colorkey(self.colorKey)
+        pygame.draw.circle(sprite, self.color, [width, width], width)
+        stamp = (sprite, -width)
+      self.stamps[key] = stamp
+
+    return stamp
+
+  def draw(self, screen, x, y, car, width, height):
+    x = numpy.asarray(x).astype(numpy.int32)
+    y = numpy.asarray(y).astype(numpy.int32)
+    car = numpy.asarray(car, dtype=numpy.bool_)
+    width = numpy.clip(width, 1, 255).astype(numpy.int32)
+    height = numpy.where(car, numpy.clip(height, 1, 255), width) # pedestrians only have a radius
+
+    # one group per sprite, sizes are small so they pack into a single code
+    code = ((car * 256 + width) * 256 + height).astype(numpy.int64)
+    sequence = []
+    for kind in numpy.flatnonzero(numpy.bincount(code)).tolist():
+      sprite, offset = self.stamp(kind >= 65536, kind // 256 % 256, kind % 256)
+      mask = code == kind
+      sequence.extend(zip([sprite] * int(mask.sum()), zip((x[mask] + offset).tolist(), (y[mask] + offset).tolist())))
+
+    if hasattr(screen, "blits"):
+      return screen.blits(sequence)
+    return [screen.blit(sprite, position) for sprite, position in sequence] # pygame before 1.9.4
@@ -0,0 +1,175 @@
+# -*- coding: utf8 -*-
+
+import pygame, numpy, math
+
+diskMasks = {}
+
+def getDiskMask(radius):
+  mask = diskMasks.get(radius)
+  if mask is None:
+    # same offsets as the old per pixel loop: range(-radius, radius) on both axes
+    offsets = numpy.arange(-radius, radius)
+    mask = (offsets[:, None] ** 2 + offsets[None, :] ** 2) <= radius * radius
+    diskMasks[radius] = mask
+  return mask
+
+class DirtyTiles:
+  def __init__(self, tiles, tileSize):
+    self.tiles = tiles
+    self.tileSize = tileSize
+
+    tilesX, tilesY = tiles.shape
+    self.integral = numpy.zeros((tilesX + 1, tilesY + 1), dtype=numpy.int32)
+    self.integral[1:, 1:] = tiles.cumsum(axis=0, dtype=numpy.int32).cumsum(axis=1)
+
+  def any(self):
+    return self.integral[-1, -1] > 0
+
+  def merge(self, other):
+    if other.tiles.shape != self.tiles.shape or other.tileSize != self.tileSize:
+      return DirtyTiles(numpy.ones_like(other.tiles), other.tileSize)
+    return DirtyTiles(self.tiles | other.tiles, self.tileSize)
+
+  def touches(self, x0, y0, x1, y1):
+    # pixel rectangles (inclusive, may be arrays) against the dirty tiles
+    tilesX, tilesY = self.tiles.shape
+    tx0 = numpy.clip(numpy.floor(numpy.asarray(x0, dtype=numpy.float64) / self.tileSize).astype(numpy.int64), 0, tilesX - 1)
+    ty0 = numpy.clip(numpy.floor(numpy.asarray(y0, dtype=numpy.float64) / self.tileSize).astype(numpy.int64), 0, tilesY - 1)
+    tx1 = numpy.clip(numpy.floor(numpy.asarray(x1, dtype=numpy.float64) / self.tileSize).astype(numpy.int64), 0, tilesX - 1) + 1
+    ty1 = numpy.clip(numpy.floor(numpy.asarray(y1, dtype=numpy.float64) / self.tileSize).astype(numpy.int64), 0, tilesY - 1) + 1
+
+    s = self.integral
+    return (s[tx1, ty1] - s[tx0, ty1] - s[tx1, ty0] + s[tx0, ty0]) > 0
+
+class OccupancyGrid:
+  def __init__(self, surface, threshold=600, tileSize=32, cells=None, integral=None):
+    self.threshold = threshold
+    self.tileSize = tileSize
+
+    # surfarray is indexed [x, y], so cells[x, y] is true where the map is a wall
+    if cells is None:
+      pixels = pygame.surfarray.array3d(surface)
+      cells = pixels.sum(axis=2, dtype=numpy.int32) < threshold
+    self.cells = cells
+    self.width, self.height = cells.shape
+
+    # summed area table with a zero border, integral[x, y] = walls in cells[:x, :y]
+    if integral is None:
+      integral = numpy.zeros((self.width + 1, self.height + 1), dtype=numpy.int32)
+      integral[1:, 1:] = self.cells.cumsum(axis=0, dtype=numpy.int32).cumsum(axis=1)
+    self.integral = integral
+
+  def changedTiles(self, previous):
+    tileSize = self.tileSize
+    tilesX = (self.width + tileSize - 1) // tileSize
+    tilesY = (self.height + tileSize - 1) // tileSize
+    if previous is None or previous.cells.shape != self.cells.shape:
+      return DirtyTiles(numpy.ones((tilesX, tilesY), dtype=numpy.bool_), tileSize)
+
+    changed = numpy.zeros((tilesX * tileSize, tilesY * tileSize), dtype=numpy.bool_)
+    changed[:self.width, :self.height] = self.cells != previous.cells
+    tiles = changed.reshape(tilesX, tileSize, tilesY, tileSize).any(axis=3).any(axis=1)
+    return DirtyTiles(tiles, tileSize)
+
+  def isSet(self, x, y):
+    if x < 0 or y < 0:
+      return True
+    if x >= self.width or y >= self.height:
+      return True
+
+    return bool(self.cells[int(x), int(y)])
+
+  def countInRect(self, x0, y0, x1, y1):
+    s = self.integral
+    return s[x1, y1] - s[x0, y1] - s[x1, y0] + s[x0, y0]
+
+  def diskIsSet(self, x, y, radius):
+    radius = int(radius)
+    cx = int(math.floor(x))
+    cy = int(math.floor(y))
+
+    if radius <= 0:
+      return self.isSet(cx, cy)
+
+    x0 = cx - radius
+    y0 = cy - radius
+    x1 = cx + radius
+    y1 = cy + radius
+    if x0 < 0 or y0 < 0 or x1 > self.width or y1 > self.height:
+      return True
+
+    if self.countInRect(x0, y0, x1, y1) == 0:
+      return False # no wall in the bounding box
+
+    inner = int(radius / math.sqrt(2))
+    if self.countInRect(cx - inner, cy - inner, cx + inner + 1, cy + inner + 1) > 0:
+      return True # wall inside the inscribed square
+
+    return bool((self.cells[x0:x1, y0:y1] & getDiskMask(radius)).any())
+
+  def disksAreSet(self, xs, ys, radii):
+    cx = numpy.floor(xs).astype(numpy.int64)
+    cy = numpy.floor(ys).astype(numpy.int64)
+    radii = numpy.maximum(numpy.asarray(radii, dtype=numpy.int64), 0)
+
+    # a zero radius degenerates to the center cell
+    x0 = cx - radii
+    y0 = cy - radii
+    x1 = numpy.maximum(cx + radii, cx + 1)
+    y1 = numpy.maximum(cy + radii, cy + 1)
+
+    result = (x0 < 0) | (y0 < 0) | (x1 > self.width) | (y1 > self.height)
+    inside = numpy.flatnonzero(~result)
+    if len(inside) == 0:
+      return result
+
+    boxCount = self.countInRect(x0[inside], y0[inside], x1[inside], y1[inside])
+    inside = inside[boxCount > 0]
+
+    inner = (radii[inside] / math.sqrt(2)).astype(numpy.int64)
+    icx = cx[inside]
+    icy = cy[inside]
+    innerCount = self.countInRect(icx - inner, icy - inner, icx + inner + 1, icy + inner + 1)
+    result[inside[innerCount > 0]] = True
+
+    for i in inside[innerCount == 0].tolist():
+      result[i] = self.diskIsSet(cx[i], cy[i], radii[i])
+
+    return result
+
+  def lineIsSet(self, start, end, startWidth=0, endWidth=None):
+    # samples at most one pixel apart along the segment; a width turns the
+    # line into the trapezoid from start +- startWidth to end +- endWidth
+    if endWidth is None:
+      endWidth = startWidth
+
+    dx = float(end[0] - start[0])
+    dy = float(end[1] - start[1])
+
+    # every sample lies in the bounding box, an empty box needs no sampling
+    halfWidth = max(startWidth, endWidth)
+    x0 = int(math.floor(min(start[0], end[0]) - halfWidth))
+    y0 = int(math.floor(min(start[1], end[1]) - halfWidth))
+    x1 = int(math.floor(max(start[0], end[0]) + halfWidth)) + 1
+    y1 = int(math.floor(max(start[1], end[1]) + halfWidth)) + 1
+    if x0 >= 0 and y0 >= 0 and x1 <= self.width and y1 <= self.height and self.countInRect(x0, y0, x1, y1) == 0:
+      return False
+
+    steps = int(math.ceil(max(abs(dx), abs(dy)))) + 1
+    t = numpy.linspace(0.0, 1.0, steps)
+    xs = start[0] + dx * t
+    ys = start[1] + dy * t
+
+    length = math.sqrt(dx * dx + dy * dy)
+    if halfWidth > 0 and length > 0:
+      lanes = numpy.linspace(-1.0, 1.0, int(math.ceil(2 * halfWidth)) + 1)[:, None]
+      widths = startWidth + (endWidth - startWidth) * t
+      xs = xs + lanes * widths * (-dy / length)
+      ys = ys + lanes * widths * (dx / length)
+
+    xs = numpy.floor(xs).astype(numpy.int64).ravel()
+    ys = numpy.floor(ys).astype(numpy.int64).ravel()
+    if (xs < 0).any() or (ys < 0).any() or (xs >= self.width).any() or (ys >= self.height).any():
+      return True
+
+    return bool(self.cells[xs, ys].any())
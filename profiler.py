@@ -0,0 +1,118 @@
+# -*- coding: utf8 -*-
+
+import json, time, timeit, numpy, pygame
+
+class Profiler:
+  def __init__(self, historySize=240, exportFile=None, exportInterval=5.0):
+    self.historySize = historySize
+    self.timers = {} # name -> [rolling samples in ms, number of samples]
+    self.names = []
+
+    self.showOverlay = False
+    self.overlay = None
+    self.overlayInterval = 0.5
+    self.lastOverlay = 0
+    self.font = None
+
+    self.exportFile = None
+    self.exportFormat = None
+    self.exportInterval = exportInterval
+    self.lastExport = timeit.default_timer()
+    if exportFile:
+      self.openExport(exportFile)
+
+    self.updateEnabled()
+
+  def updateEnabled(self):
+    # nothing is timed unless someone looks at the numbers
+    self.enabled = self.showOverlay or self.exportFile is not None
+
+  def toggleOverlay(self):
+    self.showOverlay = not self.showOverlay
+    self.overlay = None
+    self.updateEnabled()
+
+  def openExport(self, filename):
+    self.exportFormat = "csv" if filename.endswith(".csv") else "jsonl"
+    self.exportFile = open(filename, 'a')
+    if self.exportFormat == "csv" and self.exportFile.tell() == 0:
+      self.exportFile.write("time,timer,calls,mean_ms,p95_ms,max_ms\n")
+
+  def timed(self, name, function, *args):
+    if not self.enabled:
+      return function(*args)
+
+    start = timeit.default_timer()
+    result = function(*args)
+    self.record(name, (timeit.default_timer() - start) * 1000.0)
+    return result
+
+  def record(self, name, ms):
+    timer = self.timers.get(name)
+    if timer is None:
+      timer = self.timers[name] = [numpy.zeros(self.historySize), 0]
+      self.names.append(name)
+
+    timer[0][timer[1] % self.historySize] = ms
+    timer[1] += 1
+
+  def stats(self):
+    result = []
+    for name in self.names:
+      samples, calls = self.timers[name]
+      window = samples[:min(calls, self.historySize)]
+      result.append((name, calls, window.mean(), numpy.percentile(window, 95), window.max()))
+
+    return result
+
+  def tick(self):
+    if self.exportFile is None:
+      return
+
+    now = timeit.default_timer()
+    if self.lastExport + self.exportInterval < now:
+      self.lastExport = now
+      self.export()
+
+  def export(self):
+    timestamp = time.time()
+    for name, calls, mean, p95, maximum in self.stats():
+      if self.exportFormat == "csv":
+        self.exportFile.write("%.3f,%s,%d,%.4f,%.4f,%.4f\n" % (timestamp, name, calls, mean, p95, maximum))
+      else:
+        self.exportFile.write(json.dumps({"time": timestamp, "timer": name, "calls": calls,
+          "mean": mean, "p95": p95, "max": maximum}) + "\n")
+    self.exportFile.flush()
+
+  def renderOverlay(self):
+    if self.font is None:
+      self.font = pygame.font.SysFont("monospace", 14)
+
+    lines = ["%-18s %8s %8s %8s" % ("timer", "mean", "p95", "max")]
+    for name, calls, mean, p95, maximum in self.stats():
+      lines.append("%-18s %8.2f %8.2f %8.2f" % (name, mean, p95, maximum))
+
+    lineHeight = self.font.get_linesize()
+    width = max(self.font.size(line)[0] for line in lines)
+    overlay = pygame.Surface((width + 8, lineHeight * len(lines) + 8))
+    overlay.set_alpha(200)
+    for i, line in enumerate(lines):
+      overlay.blit(self.font.render(line, True, (255, 255, 255)), (4, 4 + i * lineHeight))
+
+    return overlay
+
+  def draw(self, screen):
+    # text rendering is slow, so the overlay only refreshes a few times a second
+    now = timeit.default_timer()
+    if self.overlay is None or self.lastOverlay + self.overlayInterval < now:
+      self.lastOverlay = now
+      self.overlay = self.renderOverlay()
+
+    return screen.blit(self.overlay, (0, 0))
+
+  def close(self):
+    if self.exportFile is not None:
+      self.export()
+      self.exportFile.close()
+      self.exportFile = None
+      self.updateEnabled()
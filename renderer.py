@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+
+import pygame
+
+class LayeredRenderer:
+  def __init__(self, screen, rebuildInterval=250, maxDirtyRects=500, tileSize=64):
+    self.screen = screen
+    self.static = pygame.Surface(screen.get_size()).convert()
+    self.staticKey = None
+    self.rebuildInterval = rebuildInterval
+    self.lastRebuild = 0
+    self.maxDirtyRects = maxDirtyRects
+    self.tileSize = tileSize # motive rects are merged per screen tile
+
+    self.previousRects = []
+    self.fullUpdate = True
+
+  def invalidate(self):
+    # the next frame rebuilds the static layer and presents the whole screen
+    self.staticKey = None
+
+  def updateStatic(self, key, time, drawStatic):
+    # map, blobs and roads are redrawn only when their versions changed, and at
+    # most once per rebuild interval while they keep changing
+    if self.staticKey is not None:
+      if key == self.staticKey or self.lastRebuild + self.rebuildInterval > time:
+        return
+
+    drawStatic(self.static)
+    self.staticKey = key
+    self.lastRebuild = time
+    self.fullUpdate = True
+
+  def begin(self):
+    self.screen.blit(self.static, (0, 0))
+
+  def mergeRects(self, rects):
+    # one bounding box per screen tile a rect starts in, so a full population
+    # of motives comes down to a few hundred rects
+    tileSize = self.tileSize
+    tiles = {}
+    for rect in rects:
+      if rect.width == 0 or rect.height == 0:
+        continue # nothing was drawn
+
+      key = (rect.x // tileSize, rect.y // tileSize)
+      tile = tiles.get(key)
+      if tile is None:
+        tiles[key] = pygame.Rect(rect)
+      else:
+        tile.union_ip(rect)
+    return tiles.values()
+
+  def present(self, rects):
+    # what was drawn last frame has to be erased as well
+    rects = self.mergeRects(rects)
+    dirtyRects = self.previousRects + rects
+    if self.fullUpdate or len(dirtyRects) > self.maxDirtyRects:
+      pygame.display.flip()
+    else:
+      pygame.display.update(dirtyRects)
+
+    self.previousRects = rects
+    self.fullUpdate = False
@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+
+import threading, numpy
+from blobmanager import BlobManager
+from roadmanager import RoadManager, Road
+from citylog import log
+
+class RoadJob:
+  def __init__(self, snapshot, occupancy, blobSetVersion, edges):
+    self.snapshot = snapshot
+    self.occupancy = occupancy
+    self.blobSetVersion = blobSetVersion
+    self.edges = edges # blob id pairs of the roads at request time
+    self.cancelled = threading.Event()
+    self.finished = threading.Event() # built, given up or failed
+
+class RoadBuilder:
+  # regenerates the road network in a worker thread on a snapshot of the
+  # blobs; the road manager keeps its old network until update() swaps the
+  # new one in, patched for the blobs that came or went in the meantime
+  def __init__(self, roadManager):
+    self.roadManager = roadManager
+    self.blobManager = roadManager.blobManager
+
+    self.job = None # requested and not adopted yet
+    self.pending = None # waiting for the worker
+    self.result = None # (job, built road manager) waiting for update()
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.thread = None
+    self.running = False
+
+  def start(self):
+    if self.thread is None:
+      self.running = True
+      self.thread = threading.Thread(target=self.run, name="road builder")
+      self.thread.daemon = True
+      self.thread.start()
+
+  def request(self):
+    self.start()
+
+    blobManager = self.blobManager
+    job = RoadJob(blobManager.store.snapshot(), blobManager.occupancy, blobManager.blobSetVersion,
+      self.roadManager.edges.keys())
+    with self.lock:
+      if self.job is not None:
+        self.job.cancelled.set()
+      self.job = job
+      self.pending = job
+      self.result = None
+    self.wakeup.set()
+
+  def isBusy(self):
+    return self.job is not None
+
+  def wait(self):
+    # blocks until the requested network is built and swapped in, for
+    # headless runs that have to see the same roads every time
+    job = self.job
+    if job is not None:
+      job.finished.wait()
+      self.update()
+
+  def update(self):
+    # called on the main loop, swaps in a finished network
+    job = self.job
+    if job is None:
+      return False
+
+    with self.lock:
+      result = self.result
+      self.result = None
+    if result is None or result[0] is not job:
+      return False
+
+    self.job = None
+    builder = result[1]
+    added, removed = self.changesSince(job)
+    self.roadManager.adopt(builder, added, removed)
+    log.info("roads", "regenerated %d roads", len(self.roadManager.edges))
+    return True
+
+  def changesSince(self, job):
+    # ids of the blobs added and removed after the snapshot was taken
+    blobManager = self.blobManager
+    if job.blobSetVersion == blobManager.blobSetVersion:
+      return [], []
+
+    store = blobManager.store
+    current = store.ids[store.activeSlots()]
+    snapshot = job.snapshot["ids"]
+    return numpy.setdiff1d(current, snapshot).tolist(), numpy.setdiff1d(snapshot, current).tolist()
+
+  def run(self):
+    while self.running:
+      self.wakeup.wait()
+      self.wakeup.clear()
+
+      with self.lock:
+        job = self.pending
+        self.pending = None
+
+      if job is not None and self.running:
+        try:
+          builder = self.build(job)
+        except Exception as e:
+          log.error("roads", "regenerating roads failed: %s", e)
+          with self.lock:
+            if self.job is job:
+              self.job = None # not busy anymore, the next score change asks again
+          builder = None
+
+        if builder is not None:
+          with self.lock:
+            if not job.cancelled.is_set():
+              self.result = (job, builder)
+        job.finished.set()
+
+  def build(self, job):
+    manager = self.roadManager
+    log.info("roads", "regenerating roads for %d blobs in the background...", len(job.snapshot["ids"]))
+
+    blobManager = BlobManager(manager.screenDim, job.occupancy, self.blobManager.clock, blobFile=None)
+    blobManager.store.load(job.snapshot)
+    blobManager.rebuildIndex()
+
+    builder = RoadManager(manager.screenDim, blobManager)
+    builder.triangulateCandidates = manager.triangulateCandidates
+    builder.roadBlobLimitFactor = manager.roadBlobLimitFactor
+    builder.roadLimit = manager.roadLimit
+    builder.validateRoadWidth = manager.validateRoadWidth
+    builder.cancelled = job.cancelled
+
+    # regenerate keeps the roads there are, so the job starts out with them
+    store = blobManager.store
+    for blobId, otherId in job.edges:
+      blob = store.get(blobId)
+      otherBlob = store.get(otherId)
+      if blob is not None and otherBlob is not None:
+        builder.addRoad(Road(blob, otherBlob), blob, otherBlob)
+
+    # the same steps as RoadManager.regenerate, giving up between them once cancelled
+    if builder.triangulateCandidates:
+      builder.triangulate()
+    if job.cancelled.is_set():
+      return None
+
+    builder.connect(store.ids[store.activeSlots()].tolist())
+    if job.cancelled.is_set():
+      return None
+
+    builder.updateGraph()
+    return builder
+
+  def close(self):
+    self.running = False
+    with self.lock:
+      if self.job is not None:
+        self.job.cancelled.set()
+      self.job = None
+    self.wakeup.set()
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
@@ -0,0 +1,275 @@
+# -*- coding: utf8 -*-
+
+import heapq, numpy
+
+def lookup(sortedIds, ids):
+  # position of each id in a sorted id array, -1 where it is missing
+  ids = numpy.asarray(ids, dtype=numpy.int64)
+  if len(sortedIds) == 0:
+    return numpy.full(len(ids), -1, dtype=numpy.intp)
+
+  index = numpy.minimum(numpy.searchsorted(sortedIds, ids), len(sortedIds) - 1)
+  return numpy.where(sortedIds[index] == ids, index, -1)
+
+class RoadGraph:
+  def __init__(self, roads, destinationCount=64):
+    # nodes are the blobs at either end of a road, sorted by blob id
+    ids = numpy.array([road.startId for road in roads] + [road.endId for road in roads], dtype=numpy.int64)
+    x = numpy.array([road.start.x for road in roads] + [road.end.x for road in roads], dtype=numpy.float64)
+    y = numpy.array([road.start.y for road in roads] + [road.end.y for road in roads], dtype=numpy.float64)
+    self.nodeIds, first, inverse = numpy.unique(ids, return_index=True, return_inverse=True)
+    self.x = x[first]
+    self.y = y[first]
+    self.nodeCount = len(self.nodeIds)
+
+    count = len(roads)
+    self.edgeA = inverse[:count]
+    self.edgeB = inverse[count:]
+    self.edgeLength = numpy.hypot(self.x[self.edgeA] - self.x[self.edgeB], self.y[self.edgeA] - self.y[self.edgeB])
+    self.edgeAlive = numpy.ones(count, dtype=numpy.bool_)
+    self.edges = dict((road.id, i) for i, road in enumerate(roads))
+
+    # next hop tables are kept for a random set of destinations only
+    destinationCount = min(destinationCount, self.nodeCount)
+    self.destinations = numpy.sort(numpy.random.permutation(self.nodeCount)[:destinationCount])
+    self.destinationIds = self.nodeIds[self.destinations]
+    self.nextHop = numpy.full((destinationCount, self.nodeCount), -1, dtype=numpy.int32)
+    self.distance = numpy.full((destinationCount, self.nodeCount), numpy.inf)
+
+    self.buildAdjacency()
+    for row in range(destinationCount):
+      self.computeRow(row)
+
+  def buildAdjacency(self, components=True):
+    # csr arrays over both directions of the live edges
+    alive = numpy.flatnonzero(self.edgeAlive)
+    source = numpy.concatenate([self.edgeA[alive], self.edgeB[alive]])
+    target = numpy.concatenate([self.edgeB[alive], self.edgeA[alive]])
+    length = numpy.concatenate([self.edgeLength[alive], self.edgeLength[alive]])
+    order = numpy.argsort(source, kind="mergesort")
+
+    self.neighbours = target[order]
+    self.neighbourLength = length[order]
+    self.indptr = numpy.zeros(self.nodeCount + 1, dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(source, minlength=self.nodeCount), out=self.indptr[1:])
+
+    if components:
+      self.buildComponents()
+
+  def buildComponents(self):
+    component = [-1] * self.nodeCount
+    indptr = self.indptr.tolist()
+    neighbours = self.neighbours.tolist()
+    label = 0
+    for start in range(self.nodeCount):
+      if component[start] >= 0:
+        continue
+
+      component[start] = label
+      stack = [start]
+      while stack:
+        node = stack.pop()
+        for other in neighbours[indptr[node]:indptr[node + 1]]:
+          if component[other] < 0:
+            component[other] = label
+            stack.append(other)
+      label += 1
+
+    self.component = numpy.array(component, dtype=numpy.int32)
+    self.groupDestinations()
+
+  def joinComponents(self, a, b):
+    # new edges only ever merge components, no search needed
+    component = self.component
+    for i, j in zip(a.tolist(), b.tolist()):
+      if component[i] != component[j]:
+        component[component == component[j]] = component[i]
+    self.groupDestinations()
+
+  def groupDestinations(self):
+    # destination rows grouped by component, for picking reachable destinations
+    destinationComponent = self.component[self.destinations]
+    self.rowsByComponent = numpy.argsort(destinationComponent, kind="mergesort")
+    self.sortedComponent = destinationComponent[self.rowsByComponent]
+
+  def computeRow(self, row):
+    # dijkstra outwards from the destination, every node points at its parent
+    indptr = self.indptr.tolist()
+    neighbours = self.neighbours.tolist()
+    lengths = self.neighbourLength.tolist()
+    nextHop = [-1] * self.nodeCount
+    distance = {}
+
+    destination = int(self.destinations[row])
+    nextHop[destination] = destination
+    distance[destination] = 0.0
+    heap = [(0.0, destination)]
+    while heap:
+      d, node = heapq.heappop(heap)
+      if d > distance[node]:
+        continue
+
+      for i in range(indptr[node], indptr[node + 1]):
+        other = neighbours[i]
+        newDistance = d + lengths[i]
+        if newDistance < distance.get(other, float('inf')):
+          distance[other] = newDistance
+          nextHop[other] = node
+          heapq.heappush(heap, (newDistance, other))
+
+    self.nextHop[row] = nextHop
+    self.distance[row] = numpy.inf
+    self.distance[row, distance.keys()] = distance.values()
+
+  def addNodes(self, ids, x, y):
+    # new nodes get fresh indices in id order, every table is remapped to them
+    nodeIds = numpy.concatenate([self.nodeIds, ids])
+    order = numpy.argsort(nodeIds, kind="mergesort")
+    remap = numpy.empty(len(order), dtype=numpy.intp)
+    remap[order] = numpy.arange(len(order))
+    old = remap[:self.nodeCount]
+
+    self.nodeIds = nodeIds[order]
+    self.x = numpy.concatenate([self.x, x])[order]
+    self.y = numpy.concatenate([self.y, y])[order]
+    self.nodeCount = len(order)
+    self.edgeA = old[self.edgeA]
+    self.edgeB = old[self.edgeB]
+    self.destinations = old[self.destinations]
+
+    nextHop = numpy.full((len(self.destinations), self.nodeCount), -1, dtype=numpy.int32)
+    nextHop[:, old] = numpy.where(self.nextHop >= 0, old[numpy.maximum(self.nextHop, 0)], -1)
+    self.nextHop = nextHop
+    distance = numpy.full((len(self.destinations), self.nodeCount), numpy.inf)
+    distance[:, old] = self.distance
+    self.distance = distance
+
+    # every new node starts out on its own
+    component = numpy.empty(self.nodeCount, dtype=numpy.int32)
+    component[old] = self.component
+    new = numpy.ones(self.nodeCount, dtype=numpy.bool_)
+    new[old] = False
+    label = self.component.max() + 1 if len(old) > 0 else 0
+    component[new] = label + numpy.arange(new.sum())
+    self.component = component
+
+  def addRoads(self, roads):
+    roads = [road for road in roads if road.id not in self.edges]
+    if len(roads) == 0:
+      return
+
+    ids = numpy.array([road.startId for road in roads] + [road.endId for road in roads], dtype=numpy.int64)
+    x = numpy.array([road.start.x for road in roads] + [road.end.x for road in roads], dtype=numpy.float64)
+    y = numpy.array([road.start.y for road in roads] + [road.end.y for road in roads], dtype=numpy.float64)
+    ids, first = numpy.unique(ids, return_index=True)
+    new = self.nodeIndex(ids) < 0
+    if new.any():
+      self.addNodes(ids[new], x[first][new], y[first][new])
+
+    count = len(roads)
+    a = self.nodeIndex([road.startId for road in roads])
+    b = self.nodeIndex([road.endId for road in roads])
+    length = numpy.hypot(self.x[a] - self.x[b], self.y[a] - self.y[b])
+    for i, road in enumerate(roads):
+      self.edges[road.id] = len(self.edgeA) + i
+    self.edgeA = numpy.concatenate([self.edgeA, a])
+    self.edgeB = numpy.concatenate([self.edgeB, b])
+    self.edgeLength = numpy.concatenate([self.edgeLength, length])
+    self.edgeAlive = numpy.concatenate([self.edgeAlive, numpy.ones(count, dtype=numpy.bool_)])
+    self.buildAdjacency(components=False)
+    self.joinComponents(a, b)
+
+    # only tables the new edges shorten are touched, and only where they shorten them
+    for row in range(len(self.destinations)):
+      distance = self.distance[row]
+      viaA = distance[a] + length < distance[b]
+      viaB = distance[b] + length < distance[a]
+      if viaA.any() or viaB.any():
+        self.relaxRow(row, numpy.concatenate([b[viaA], a[viaB]]), numpy.concatenate([a[viaA], b[viaB]]),
+          numpy.concatenate([(distance[a] + length)[viaA], (distance[b] + length)[viaB]]))
+
+  def relaxRow(self, row, nodes, parents, distances):
+    # dijkstra from the improved nodes outwards, stopping where nothing improves
+    indptr = self.indptr.tolist()
+    neighbours = self.neighbours.tolist()
+    lengths = self.neighbourLength.tolist()
+    nextHop = self.nextHop[row]
+    distance = self.distance[row]
+
+    heap = []
+    for node, parent, d in zip(nodes.tolist(), parents.tolist(), distances.tolist()):
+      if d < distance[node]:
+        distance[node] = d
+        nextHop[node] = parent
+        heapq.heappush(heap, (d, node))
+
+    while heap:
+      d, node = heapq.heappop(heap)
+      if d > distance[node]:
+        continue
+
+      for i in range(indptr[node], indptr[node + 1]):
+        other = neighbours[i]
+        newDistance = d + lengths[i]
+        if newDistance < distance[other]:
+          distance[other] = newDistance
+          nextHop[other] = node
+          heapq.heappush(heap, (newDistance, other))
+
+  def removeRoads(self, roads):
+    removed = [self.edges.pop(road.id) for road in roads if road.id in self.edges]
+    if len(removed) == 0:
+      return
+
+    removed = numpy.array(removed)
+    self.edgeAlive[removed] = False
+    self.buildAdjacency()
+
+    # only tables routing over a removed edge have to be recomputed
+    a = self.edgeA[removed]
+    b = self.edgeB[removed]
+    stale = ((self.nextHop[:, a] == b) | (self.nextHop[:, b] == a)).any(axis=1)
+    for row in numpy.flatnonzero(stale).tolist():
+      self.computeRow(row)
+
+  def nodeIndex(self, ids):
+    return lookup(self.nodeIds, ids)
+
+  def destinationRow(self, ids):
+    return lookup(self.destinationIds, ids)
+
+  def randomDestinationRow(self, nodes):
+    # a destination in the same component, -1 where none is reachable
+    if len(self.rowsByComponent) == 0:
+      return numpy.full(len(nodes), -1, dtype=numpy.intp)
+
+    component = self.component[nodes]
+    first = numpy.searchsorted(self.sortedComponent, component, side="left")
+    last = numpy.searchsorted(self.sortedComponent, component, side="right")
+    pick = first + (numpy.random.random(len(nodes)) * (last - first)).astype(numpy.intp)
+    return numpy.where(last > first, self.rowsByComponent[numpy.minimum(pick, len(self.rowsByComponent) - 1)], -1)
+
+  def randomNeighbour(self, nodes):
+    if len(self.neighbours) == 0:
+      return numpy.full(len(nodes), -1, dtype=numpy.intp)
+
+    degree = self.indptr[nodes + 1] - self.indptr[nodes]
+    pick = self.indptr[nodes] + (numpy.random.random(len(nodes)) * degree).astype(numpy.intp)
+    return numpy.where(degree > 0, self.neighbours[numpy.minimum(pick, len(self.neighbours) - 1)], -1)
+
+  def route(self, nodes, rows):
+    # next node towards each destination row, a random neighbour without one
+    rows = numpy.asarray(rows)
+    hop = numpy.full(len(nodes), -1, dtype=numpy.intp)
+    routed = rows >= 0
+    hop[routed] = self.nextHop[rows[routed], nodes[routed]]
+
+    lost = (hop < 0) | (hop == nodes)
+    hop[lost] = self.randomNeighbour(nodes[lost])
+    return hop
+
+  def randomEdges(self, count):
+    alive = numpy.flatnonzero(self.edgeAlive)
+    if len(alive) == 0:
+      return alive
+    return alive[numpy.random.randint(len(alive), size=count)]
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+
+import sys, random, heapq, math, numpy
+
+from vector import Vector
+from roadgraph import RoadGraph
+
+class CheckRoad:
+  # the parts of a road the graph looks at
+  def __init__(self, id, startId, endId, points):
+    self.id = id
+    self.startId = startId
+    self.start = points[startId]
+    self.endId = endId
+    self.end = points[endId]
+
+def shortestDistances(roads, points, destination):
+  # plain dijkstra over the live roads, blob id -> distance
+  neighbours = {}
+  for road in roads:
+    length = Vector.distance(points[road.startId], points[road.endId])
+    neighbours.setdefault(road.startId, []).append((road.endId, length))
+    neighbours.setdefault(road.endId, []).append((road.startId, length))
+
+  distance = { destination: 0.0 }
+  heap = [(0.0, destination)]
+  while heap:
+    d, node = heapq.heappop(heap)
+    if d > distance[node]:
+      continue
+
+    for other, length in neighbours.get(node, []):
+      if d + length < distance.get(other, float('inf')):
+        distance[other] = d + length
+        heapq.heappush(heap, (d + length, other))
+
+  return distance
+
+def compare(graph, roads, points, tolerance=1e-6):
+  # distances against a fresh dijkstra, next hops against the edges they follow
+  errors = []
+  lengths = {}
+  for road in roads:
+    length = Vector.distance(points[road.startId], points[road.endId])
+    lengths[(road.startId, road.endId)] = length
+    lengths[(road.endId, road.startId)] = length
+
+  nodeIds = graph.nodeIds.tolist()
+  for row, destination in enumerate(graph.destinationIds.tolist()):
+    expected = shortestDistances(roads, points, destination)
+    distance = graph.distance[row].tolist()
+    nextHop = graph.nextHop[row].tolist()
+    for node, blobId in enumerate(nodeIds):
+      want = expected.get(blobId, float('inf'))
+      got = distance[node]
+      if math.isinf(want) or math.isinf(got):
+        if math.isinf(want) != math.isinf(got):
+          errors.append("destination %d, node %d: distance %s, expected %s" % (destination, blobId, got, want))
+        elif nextHop[node] >= 0:
+          errors.append("destination %d, node %d: unreachable but routed to %d" % (destination, blobId, nodeIds[nextHop[node]]))
+        continue
+
+      if abs(got - want) > tolerance:
+        errors.append("destination %d, node %d: distance %s, expected %s" % (destination, blobId, got, want))
+      if blobId == destination:
+        continue
+
+      hop = nextHop[node]
+      length = lengths.get((blobId, nodeIds[hop])) if hop >= 0 else None
+      if length is None:
+        errors.append("destination %d, node %d: next hop %d is not a neighbour" % (destination, blobId, hop))
+      elif abs(distance[hop] + length - got) > tolerance:
+        errors.append("destination %d, node %d: next hop %d is not on a shortest path" % (destination, blobId, nodeIds[hop]))
+
+  return errors
+
+def check(seed, nodeCount=60, steps=40, screenDim=(1024, 786)):
+  # grows and shrinks a random network through addRoads and removeRoads,
+  # comparing the incremental tables against dijkstra after every step
+  random.seed(seed)
+  numpy.random.seed(seed)
+
+  points = dict((blobId, Vector(random.random() * screenDim[0], random.random() * screenDim[1])) for blobId in range(nodeCount))
+  pairs = [(a, b) for a in range(nodeCount) for b in range(a + 1, nodeCount)]
+  random.shuffle(pairs)
+
+  nextId = [0]
+  def newRoad():
+    a, b = pairs.pop()
+    nextId[0] += 1
+    return CheckRoad("road %d" % nextId[0], a, b, points)
+
+  roads = [newRoad() for i in range(nodeCount)]
+  graph = RoadGraph(roads, destinationCount=16)
+  errors = compare(graph, roads, points)
+
+  for step in range(steps):
+    if errors:
+      break
+
+    if random.random() < 0.6 or len(roads) < 4:
+      added = [newRoad() for i in range(random.randint(1, 5))]
+      roads.extend(added)
+      graph.addRoads(added)
+    else:
+      random.shuffle(roads)
+      count = random.randint(1, 4)
+      removed = roads[:count]
+      roads = roads[count:]
+      graph.removeRoads(removed)
+    errors = compare(graph, roads, points)
+
+  return errors
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="check incremental road graph routing against a plain dijkstra")
+  parser.add_argument("--seeds", type=int, default=20, help="random networks to check")
+  parser.add_argument("--nodes", type=int, default=60)
+  parser.add_argument("--steps", type=int, default=40, help="road additions and removals per network")
+  args = parser.parse_args()
+
+  failed = 0
+  for seed in range(args.seeds):
+    errors = check(seed, args.nodes, args.steps)
+    if errors:
+      failed += 1
+      print "seed %d: %d mismatches" % (seed, len(errors))
+      for error in errors[:10]:
+        print "  " + error
+
+  print "%d of %d road networks matched" % (args.seeds - failed, args.seeds)
+  sys.exit(1 if failed else 0)
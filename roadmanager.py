@@ -1,5 +1,9 @@
 # -*- coding: utf8 -*-
-import pygame, uuid, math
+import pygame, uuid, collections, numpy
+from vector import Vector, VectorArray
+from citylog import log, LogLevel
+from roadgraph import RoadGraph
+from delaunay import Triangulation
 
 class Road:
   def __init__(self, startBlob, endBlob):
@@ -46,78 +50,324 @@ class Road:
         end   = origin + (slope * (index + 1) * dash_length)
         pygame.draw.line(surf, color, start.toIntArr(), end.toIntArr(), width)
 
-class RoadManager:
+class RoadManager(object):
   def __init__(self, screenDim, blobManager):
     self.screenDim = screenDim
     self.blobManager = blobManager
 
-    self.roads = []
-
-    self.roadDict = {}
+    self.edges = {} # (smaller blob id, larger blob id) -> road
+    self.version = 0 # bumped whenever the drawn roads change
+    self.roadDict = {} # blob id -> roads ending at that blob
+    self.reconnect = set() # blobs that lost a road and may take a new one
+    self.recheck = collections.OrderedDict() # road id -> road that moved and is validated again
+    self.pendingPairs = collections.deque() # blob id pairs waiting to be connected
+    self.workBudget = 200 # rechecks and connections per update, a count so headless runs stay deterministic
+    self.cancelled = None # an event that stops connect early, see RoadBuilder
+
+    self.graph = None
+    self.graphStale = False # rebuild the graph from scratch on the next update
+    self.addedRoads = []
+    self.removedRoads = []
+
+    self.maintenanceInterval = 1000
+    self.lastMaintenance = 0
+
+    # road candidates are the gabriel edges of a triangulation of the blob centres
+    self.triangulateCandidates = True
+    self.triangulation = None
+    self.vertexIds = [] # triangulation point -> blob id, -1 once the blob is gone
+    self.vertexOf = {}
+    self.deadVertices = 0
+    self.maxDeadVertices = 0.1 # rebuild once this fraction of the vertices is gone or moved
+    self.vertexDrift = 8 # px a blob moves before its vertex is inserted again
+    self.waiting = set() # blobs whose candidates may be hidden by a hole until the next rebuild
 
     self.roadBlobLimitFactor = 3
     self.roadLimit = 2
 
     self.drawRoad = True
     self.drawLine = True
+    self.validateRoadWidth = True
+    self.dirtyTiles = None
+
+  @property
+  def roads(self):
+    return self.edges.values()
+
+  def edgeKey(self, a, b):
+    return (a, b) if a < b else (b, a)
+
+  def addRoad(self, road, startBlob, endBlob):
+    self.edges[self.edgeKey(road.startId, road.endId)] = road
+    self.roadDict.setdefault(road.startId, []).append(road)
+    self.roadDict.setdefault(road.endId, []).append(road)
+    startBlob.roads.append(road)
+    endBlob.roads.append(road)
+    self.addedRoads.append(road)
+    self.version += 1
+
+  def removeRoad(self, road):
+    if self.edges.pop(self.edgeKey(road.startId, road.endId), None) is None:
+      return
+
+    store = self.blobManager.store
+    for blobId in [road.startId, road.endId]:
+      roads = self.roadDict.get(blobId)
+      if roads is not None and road in roads:
+        roads.remove(road)
+
+      blob = store.get(blobId)
+      if blob is not None:
+        if road in blob.roads:
+          blob.roads.remove(road)
+        self.reconnect.add(blobId)
+
+    self.removedRoads.append(road)
+    self.version += 1
+
+  def invalidate(self, dirtyTiles):
+    if self.dirtyTiles is None:
+      self.dirtyTiles = dirtyTiles
+    else:
+      self.dirtyTiles = self.dirtyTiles.merge(dirtyTiles)
 
   def validate(self, road):
-    result = True
-
-    delta = road.end - road.start
-    if delta.x == 0:
-      delta.x = 0.000001
-    error = 0.0
-    deltaErr = abs(delta.y / float(delta.x))
-    y = int(road.end.y)
-    points = []
-    for x in range(int(road.start.x), int(road.end.x)):
-      pos = [x, y]
-      points.append(pos)
-      error = error + deltaErr
-      while error >= 0.5:
-        if not pos in points:
-          points.append(pos)
-
-        y += int(math.copysign(1, road.end.y - road.start.y))
-        error = error - 1.0
-
-        pos = [x, y]
-
-    for p in points:
-      if self.blobManager.isSet(p):
-        result = False
-        break
+    occupancy = self.blobManager.occupancy
+    if not occupancy:
+      return False
 
-    return result
+    if self.validateRoadWidth:
+      return not occupancy.lineIsSet(road.start, road.end, road.startRadius, road.endRadius)
+    return not occupancy.lineIsSet(road.start, road.end)
 
   def update(self, dt):
+    self.revalidateDirty()
+
+    time = self.blobManager.clock.getTicks()
+    if self.lastMaintenance + self.maintenanceInterval < time:
+      self.lastMaintenance = time
+      self.maintain()
+
+    self.processPending()
+    self.updateGraph()
+
+  def revalidateDirty(self):
+    # roads only change when the map under them does
+    dirtyTiles = self.dirtyTiles
+    self.dirtyTiles = None
+    if dirtyTiles is None or not dirtyTiles.any() or len(self.edges) == 0:
+      return
+
+    roads = self.roads
+    width = [max(road.startRadius, road.endRadius) if self.validateRoadWidth else 0 for road in roads]
+    x0 = [min(road.start.x, road.end.x) - w for road, w in zip(roads, width)]
+    y0 = [min(road.start.y, road.end.y) - w for road, w in zip(roads, width)]
+    x1 = [max(road.start.x, road.end.x) + w for road, w in zip(roads, width)]
+    y1 = [max(road.start.y, road.end.y) + w for road, w in zip(roads, width)]
+    touched = dirtyTiles.touches(x0, y0, x1, y1)
+
     deadRoads = []
-    for road in self.roads:
-      if not self.validate(road):
+    for road, isTouched in zip(roads, touched.tolist()):
+      if isTouched and not self.validate(road):
         deadRoads.append(road)
 
-    for road in deadRoads:
-      print "removing road at", road.start, road.end
-      self.roads.remove(road)
+    self.removeDeadRoads(deadRoads)
 
-  def draw(self, screen):
-    for road in self.roads:
-      if self.drawRoad:
-        road.drawRoad(screen)
+  def removeDeadRoads(self, deadRoads):
+    log.count("roads removed", len(deadRoads))
+    debug = log.isEnabled(LogLevel.Debug)
+    for road in deadRoads:
+      if debug:
+        log.debug("roads", "removing road at %s %s", road.start, road.end)
+      self.removeRoad(road)
+
+  def maintain(self):
+    # only the neighbourhood of blobs that changed since the last pass is touched
+    added, moved, removed = self.blobManager.takeBlobChanges()
+
+    for blobId in removed:
+      for road in list(self.roadDict.pop(blobId, [])):
+        self.removeRoad(road)
+      self.reconnect.discard(blobId)
+      self.waiting.discard(blobId)
+
+    connect = added | self.reconnect
+    self.reconnect = set()
+
+    if self.triangulateCandidates:
+      # vertices are only ever marked dead, so removed and drifted blobs leave
+      # holes without candidates across them until the triangulation is rebuilt
+      drifted = self.driftedVertices(moved) if self.triangulation is not None else []
+      dead = self.deadVertices + len(removed) + len(drifted)
+      if self.triangulation is None or dead > self.maxDeadVertices * len(self.vertexOf):
+        self.triangulate()
+        connect |= self.waiting
+        self.waiting = set()
       else:
-        road.drawDebugLine(screen)
+        for blobId in removed:
+          self.removeVertex(blobId)
+        for blobId in drifted:
+          self.removeVertex(blobId)
+          self.addVertex(blobId)
+        for blobId in added:
+          self.addVertex(blobId)
+        connect.update(drifted)
+        if self.deadVertices > 0:
+          self.waiting |= connect
+
+    self.refresh(moved)
+
+    if self.triangulateCandidates:
+      self.pendingPairs.extend(self.candidates(connect))
+    else:
+      self.connect(connect)
+
+  def processPending(self):
+    # validating roads is what makes a pass slow, the queues are worked off
+    # over several updates instead of stalling one of them
+    budget = self.workBudget
 
-    if self.drawRoad and self.drawLine:
-      for road in self.roads:
-        road.drawLine(screen)
-
-  def regenerate(self):
-    print "regenerating roads (for " + str(len(self.blobManager.blobs)) + " blobs)..."
+    deadRoads = []
+    while self.recheck and budget > 0:
+      roadId, road = self.recheck.popitem(last=False)
+      if self.edges.get(self.edgeKey(road.startId, road.endId)) is road and not self.validate(road):
+        deadRoads.append(road)
+      budget -= 1
+    self.removeDeadRoads(deadRoads)
+
+    while self.pendingPairs and budget > 0:
+      blobId, otherId = self.pendingPairs.popleft()
+      self.connectPair(blobId, otherId)
+      budget -= 1
+
+  def refresh(self, blobIds):
+    # follow blobs that moved or grew, roads they may no longer fit are
+    # queued for processPending
+    store = self.blobManager.store
+    moved = False
+    for blobId in blobIds:
+      roads = self.roadDict.get(blobId)
+      slot = store.slotOf(blobId)
+      if not roads or slot < 0:
+        continue
+
+      pos = Vector(float(store.x[slot]), float(store.y[slot]))
+      radius = int(store.radius[slot])
+      for road in roads:
+        if road.startId == blobId:
+          road.start = pos
+          road.startRadius = radius
+        else:
+          road.end = pos
+          road.endRadius = radius
+        self.recheck[road.id] = road
+        moved = True
+
+    # the graph keeps the old node positions, close enough for steering motives
+    if moved:
+      self.version += 1
+
+  def triangulate(self):
+    # positions drift as blobs grow, so a full sweep starts from a fresh triangulation
+    store = self.blobManager.store
+    self.triangulation = Triangulation(self.screenDim)
+    self.vertexIds = []
+    self.vertexOf = {}
+    self.deadVertices = 0
+    self.maxDeadVertices = 0.1 # rebuild once this fraction of the vertices is gone or moved
+    self.vertexDrift = 8 # px a blob moves before its vertex is inserted again
+    self.waiting = set() # blobs whose candidates may be hidden by a hole until the next rebuild
+    for blobId in store.ids[store.activeSlots()].tolist():
+      self.addVertex(blobId)
+
+  def addVertex(self, blobId):
+    store = self.blobManager.store
+    slot = store.slotOf(blobId)
+    if slot < 0 or blobId in self.vertexOf:
+      return
+
+    vertex = self.triangulation.insert(float(store.x[slot]), float(store.y[slot]))
+    if vertex >= 0: # a blob on top of another one gets no vertex
+      self.vertexIds.append(blobId)
+      self.vertexOf[blobId] = vertex
+
+  def driftedVertices(self, blobIds):
+    # blobs that moved too far from the point they were triangulated at
+    store = self.blobManager.store
+    points = self.triangulation
+    result = []
+    for blobId in blobIds:
+      vertex = self.vertexOf.get(blobId)
+      slot = store.slotOf(blobId)
+      if vertex is None or slot < 0:
+        continue
+
+      dx = float(store.x[slot]) - points.x[vertex + 3] # the super triangle comes first
+      dy = float(store.y[slot]) - points.y[vertex + 3]
+      if dx * dx + dy * dy > self.vertexDrift ** 2:
+        result.append(blobId)
+    return result
 
-    for blob in self.blobManager.blobs:
-      if not self.roadDict.has_key(blob.id):
-        self.roadDict[blob.id] = []
+  def removeVertex(self, blobId):
+    vertex = self.vertexOf.pop(blobId, None)
+    if vertex is not None:
+      self.vertexIds[vertex] = -1
+      self.deadVertices += 1
+
+  def candidates(self, blobIds):
+    # blob id pairs of the gabriel edges touching any of the given blobs
+    if len(self.vertexIds) == 0:
+      return []
+
+    pairs = numpy.array(self.vertexIds, dtype=numpy.int64)[self.triangulation.gabrielEdges()]
+    pairs = pairs[(pairs >= 0).all(axis=1)]
+    blobIds = numpy.array(list(blobIds), dtype=numpy.int64)
+    touching = numpy.in1d(pairs[:, 0], blobIds) | numpy.in1d(pairs[:, 1], blobIds)
+    return pairs[touching].tolist()
+
+  def connect(self, blobIds):
+    if len(blobIds) == 0:
+      return
+
+    if not self.triangulateCandidates:
+      self.connectNearby(blobIds)
+      return
+
+    for blobId, otherId in self.candidates(blobIds):
+      if self.cancelled is not None and self.cancelled.is_set():
+        return
+      self.connectPair(blobId, otherId)
+
+  def connectPair(self, blobId, otherId):
+    if self.edgeKey(blobId, otherId) in self.edges:
+      return # already connected
+
+    store = self.blobManager.store
+    blob = store.get(blobId)
+    otherBlob = store.get(otherId)
+    if blob is None or otherBlob is None:
+      return
+
+    if len(blob.roads) > self.roadLimit or len(otherBlob.roads) > self.roadLimit:
+      return # already too many roads
+
+    roadBlobLimit = max(blob.radius, otherBlob.radius) * self.roadBlobLimitFactor
+    if Vector.distanceSqr(blob.pos, otherBlob.pos) >= roadBlobLimit ** 2:
+      return # too far apart
+
+    newRoad = Road(blob, otherBlob)
+    if self.validate(newRoad):
+      self.addRoad(newRoad, blob, otherBlob)
+
+  def connectNearby(self, blobIds):
+    store = self.blobManager.store
+    for blobId in blobIds:
+      if self.cancelled is not None and self.cancelled.is_set():
+        return
+
+      blob = store.get(blobId)
+      if blob is None:
+        continue
 
       if len(blob.roads) > self.roadLimit:
         continue # already too many roads
@@ -126,28 +376,115 @@ class RoadManager:
       otherBlobs = self.blobManager.findCloseBlobs(blob, roadBlobLimit)
 
       for otherBlob in otherBlobs:
-        if not self.roadDict.has_key(otherBlob.id):
-          self.roadDict[otherBlob.id] = []
-
-        if otherBlob.id == blob.id:
-          continue
-
-        if otherBlob.id in self.roadDict[blob.id]:
-          continue # already has a road to that blob
-
-        if blob.id in self.roadDict[otherBlob.id]:
-          continue # already has a road from that blob
+        if self.edgeKey(blobId, otherBlob.id) in self.edges:
+          continue # already connected
 
         if len(otherBlob.roads) > self.roadLimit:
           continue # already too many roads
 
         newRoad = Road(blob, otherBlob)
         if self.validate(newRoad):
-          self.roadDict[blob.id].append(otherBlob.id)
-          self.roadDict[otherBlob.id].append(blob.id)
+          self.addRoad(newRoad, blob, otherBlob)
+
+  def updateGraph(self):
+    addedRoads = self.addedRoads
+    removedRoads = self.removedRoads
+    self.addedRoads = []
+    self.removedRoads = []
+
+    # a few new roads only relax the next hop tables they shorten, a
+    # rebuild is cheaper once a large part of the network is new
+    if self.graph is None or self.graphStale or len(addedRoads) > len(self.graph.edges) / 2:
+      self.graphStale = False
+      if self.graph is not None or len(addedRoads) > 0:
+        self.graph = RoadGraph(self.roads)
+      return
+
+    if len(addedRoads) > 0:
+      self.graph.addRoads(addedRoads)
+    if len(removedRoads) > 0:
+      self.graph.removeRoads(removedRoads)
+
+  def adopt(self, builder, added=(), removed=()):
+    # take over a network built on a snapshot of the blobs, see RoadBuilder;
+    # added and removed are the blobs that changed since the snapshot
+    store = self.blobManager.store
+    for slot in store.activeSlots().tolist():
+      store.roads[slot] = []
+    for road in builder.roads:
+      for blobId in [road.startId, road.endId]:
+        blob = store.get(blobId)
+        if blob is not None:
+          blob.roads.append(road)
+
+    self.edges = builder.edges
+    self.roadDict = builder.roadDict
+    self.reconnect = set()
+    self.recheck = collections.OrderedDict()
+    self.pendingPairs = collections.deque()
+    self.triangulation = builder.triangulation
+    self.vertexIds = builder.vertexIds
+    self.vertexOf = builder.vertexOf
+    self.deadVertices = builder.deadVertices
+    self.waiting = set()
+    self.graph = builder.graph
+    self.graphStale = False
+    self.addedRoads = []
+    self.removedRoads = []
+    self.version += 1
+
+    # roads to blobs that are gone go the same way as in maintain
+    for blobId in removed:
+      for road in list(self.roadDict.pop(blobId, [])):
+        self.removeRoad(road)
+      self.removeVertex(blobId)
+    if self.triangulateCandidates:
+      for blobId in added:
+        self.addVertex(blobId)
+    self.connect(added)
+
+    # blobs kept growing while the snapshot was worked on
+    self.refresh(self.roadDict.keys())
+    self.updateGraph()
+
+  def draw(self, screen):
+    roads = self.roads
+    if self.drawRoad:
+      self.drawRoads(screen, roads)
+    else:
+      for road in roads:
+        road.drawDebugLine(screen)
+
+    if self.drawRoad and self.drawLine:
+      for road in roads:
+        road.drawLine(screen)
+
+  def drawRoads(self, screen, roads):
+    # the corners of every road polygon in one go, same shape as Road.drawRoad
+    if len(roads) == 0:
+      return
+
+    start = VectorArray([road.start for road in roads])
+    end = VectorArray([road.end for road in roads])
+    startRadius = numpy.array([road.startRadius for road in roads], dtype=numpy.float64)
+    endRadius = numpy.array([road.endRadius for road in roads], dtype=numpy.float64)
+
+    left = (end - start).normalize().perpendicularLeft()
+    p1 = (start + left * startRadius).toIntArr()
+    p2 = (start - left * startRadius).toIntArr()
+    p3 = (end - left * endRadius).toIntArr()
+    p4 = (end + left * endRadius).toIntArr()
+    for road, a, b, c, d in zip(roads, p1, p2, p3, p4):
+      pygame.draw.polygon(screen, road.roadColor, [a, b, c, d])
+
+  def regenerate(self):
+    # full sweep over every blob, the incremental passes in update keep it current
+    log.info("roads", "regenerating roads for %d blobs...", len(self.blobManager.store))
 
-          self.roads.append(newRoad)
-          blob.roads.append(newRoad)
-          otherBlob.roads.append(newRoad)
+    store = self.blobManager.store
+    if self.triangulateCandidates:
+      self.triangulate()
+    self.connect(store.ids[store.activeSlots()].tolist())
+    self.updateGraph()
 
-    print "done."
+    log.info("roads", "regenerated %d roads", len(self.edges))
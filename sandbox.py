@@ -5,6 +5,9 @@ import pygame, jsonpickle, uuid
 from os import path
 from random import random, choice
 from vector import Vector
+from mapsource import createMapSource
+from citylog import log
+from motiverenderer import MotiveRenderer
 
 class MotiveType:
   Unknown = 0
@@ -16,7 +19,7 @@ class Motive:
     self.pos = Vector(pos)
     self.direction = direction
     self.type = t
-    self.speed = random()
+    self.speed = random() # pixels per step at 40 steps per second
     self.age = pygame.time.get_ticks()
     self.ttl = 15000 + 5000 * random()
 
@@ -29,7 +32,7 @@ class Motive:
       self.size = [int(size*2 + random()), int(size*2 + random() * 2)]
 
   def update(self, dt, checkForCollision):
-    newPos = self.pos + self.direction * self.speed
+    newPos = self.pos + self.direction * (self.speed * dt * 40.0)
 
     if checkForCollision(newPos):
       self.direction = choice([self.direction.getLeftPerpendicular(), self.direction.getRightPerpendicular()])
@@ -55,7 +58,7 @@ class Motive:
 
 class Main:
 
-  def __init__(self):
+  def __init__(self, mapSource=None):
     pygame.init()
 
     self.screenDim = (1440, 900)
@@ -64,6 +67,7 @@ class Main:
     self.running = False
 
     self.mapData = None
+    self.occupancy = None
     #self.mapDataPath = "data/test_"
     self.mapDataPath = "map.png"
 
@@ -73,38 +77,31 @@ class Main:
     self.drawBackground = True
     self.drawRoad = True
     self.threshold = 600
+    if isinstance(mapSource, basestring):
+      self.mapSource = createMapSource(mapSource, self.screenDim, self.threshold)
+    else:
+      self.mapSource = mapSource or createMapSource(self.mapDataPath, self.screenDim, self.threshold)
 
     self.motives = []
+    self.motiveRenderer = MotiveRenderer((255, 255, 255))
     self.populationLimit = 1000
 
   def reloadMap(self):
-    list = range(1, 11)
-    list.reverse()
-    for i in list:
-      #filename = self.mapDataPath
-      filename = self.mapDataPath# + str(i) + ".png"
-      if path.isfile(filename):
-        #print filename
-        img = pygame.image.load(filename)
-        self.mapData = pygame.transform.scale(img, self.screenDim)
-        break
-    #print "done " + str(self.mapData)
-
-  def isSet(self, pos):
-    if not self.mapData:
-      print "no mapData yet"
-      return True
+    if self.mapData is None:
+      self.mapSource.load()
+    self.mapSource.request()
 
-    if not isinstance(pos, Vector):
-      pos = Vector(pos)
+  def applyMap(self):
+    loaded = self.mapSource.poll()
+    if loaded:
+      self.mapData, self.occupancy, dirtyTiles = loaded
 
-    if pos.x < 0 or pos.y < 0:
-      return True
-    if pos.x >= self.screenDim[0] or pos.y >= self.screenDim[1]:
+  def isSet(self, pos):
+    if not self.occupancy:
+      log.debug("map", "no mapData yet")
       return True
 
-    px = self.mapData.get_at(pos.toIntArr())
-    return (px.r + px.g + px.b) < self.threshold
+    return self.occupancy.isSet(pos[0], pos[1])
 
   def poll(self):
     events = pygame.event.get()
@@ -136,6 +133,7 @@ class Main:
       self.lastMapReload = time
       #print "reloading map..."
       self.reloadMap()
+    self.applyMap()
 
     for motive in self.motives:
       motive.update(dt, self.isSet)
@@ -153,8 +151,11 @@ class Main:
     else:
       self.screen.fill((0,0,0))
 
-    for motive in self.motives:
-      motive.draw(self.screen)
+    motives = self.motives
+    cars = [motive.type == MotiveType.Car for motive in motives]
+    self.motiveRenderer.draw(self.screen, [motive.pos.x for motive in motives], [motive.pos.y for motive in motives], cars,
+      [motive.size[0] if car else motive.size for motive, car in zip(motives, cars)],
+      [motive.size[1] if car else motive.size for motive, car in zip(motives, cars)])
 
   def run(self):
 
@@ -170,6 +171,7 @@ class Main:
       self.draw()
 
       pygame.display.flip()
+      log.tick()
 
 if __name__ == '__main__':
   main = Main()
@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+
+import timeit
+from citylog import log
+
+class Task:
+  def __init__(self, name, function, rate=None, shed=False):
+    self.name = name
+    self.function = function
+    self.interval = 1.0 / rate if rate else None # seconds per fixed step, none for triggered tasks
+    self.shed = shed
+
+    self.accumulator = None # due right away, then every interval
+    self.pending = False
+    self.cost = 0.0 # smoothed ms per run
+    self.skipped = 0
+
+class Scheduler:
+  # fixed step accumulation per subsystem, tasks marked shed are skipped
+  # rather than stretching the frame once the update budget is used up
+  def __init__(self, budget=15.0, profiler=None, maxSteps=4, maxSkipped=4):
+    self.tasks = []
+    self.taskDict = {}
+    self.budget = budget # ms per frame for all tasks together, none never sheds on time
+    self.profiler = profiler
+    self.maxSteps = maxSteps # catching up beyond this drops the backlog
+    self.maxSkipped = maxSkipped # a shed task still runs after this many skips
+
+  def add(self, name, function, rate=None, shed=False):
+    task = Task(name, function, rate, shed)
+    self.tasks.append(task)
+    self.taskDict[name] = task
+    return task
+
+  def trigger(self, name):
+    self.taskDict[name].pending = True
+
+  def runTask(self, task, dt):
+    start = timeit.default_timer()
+    if self.profiler:
+      self.profiler.timed("update." + task.name, task.function, dt)
+    else:
+      task.function(dt)
+    duration = (timeit.default_timer() - start) * 1000.0
+    task.cost = duration if task.cost == 0 else task.cost * 0.8 + duration * 0.2
+
+  def update(self, dt):
+    start = timeit.default_timer()
+    for task in self.tasks:
+      if task.interval is None:
+        if task.pending:
+          task.pending = False
+          self.runTask(task, dt)
+        continue
+
+      if task.accumulator is None:
+        task.accumulator = task.interval
+      else:
+        task.accumulator += dt
+      steps = int(task.accumulator / task.interval + 1e-6)
+      if steps == 0:
+        continue
+
+      if steps > self.maxSteps:
+        steps = self.maxSteps
+        task.accumulator = steps * task.interval
+      task.accumulator = max(task.accumulator - steps * task.interval, 0.0)
+
+      # work that may be shed never catches up, missed ticks are just gone
+      if task.shed and steps > 1:
+        log.count("%s ticks shed" % task.name, steps - 1)
+        steps = 1
+
+      elapsed = (timeit.default_timer() - start) * 1000.0
+      if task.shed and self.budget is not None and task.skipped < self.maxSkipped and elapsed + task.cost > self.budget:
+        task.skipped += 1
+        log.count("%s ticks shed" % task.name, steps)
+        continue
+
+      task.skipped = 0
+      for i in range(steps):
+        self.runTask(task, task.interval)
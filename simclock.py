@@ -0,0 +1,17 @@
+# -*- coding: utf8 -*-
+
+import pygame
+
+class PygameClock:
+  def getTicks(self):
+    return pygame.time.get_ticks()
+
+class ManualClock:
+  def __init__(self, ticks=0):
+    self.ticks = ticks
+
+  def getTicks(self):
+    return self.ticks
+
+  def advance(self, ms):
+    self.ticks += ms
@@ -1,102 +1,88 @@
-import pygame
-from random import random, choice
-from vector import Vector
-
-class MotiveType:
-  Unknown = 0
-  Pedestrian = 1
-  Car = 2
-
-class Motive:
-  def __init__(self, start, target, targetId, t):
-    self.pos = Vector(start)
-    self.start = start
-    self.target = target
-    self.targetId = targetId
-    self.type = t
-    self.speed = random()
-    self.age = pygame.time.get_ticks()
-    self.ttl = 15000 + 5000 * random()
-
-    self.arrivedAtTarget = False
-    self.minTargetDistance = 10
-    self.color = (255, 0, 0)
-
-    size = 1
-    if self.type == MotiveType.Pedestrian:
-      self.size = int(size)
-    if self.type == MotiveType.Car:
-      self.size = [int(size + random() * 2), int(size + random() * 2)]
-
-  def update(self, dt):
-    direction = (self.target - self.start).getNormalized()
-    variation = 0
-    if random() > 0.5:
-      variation = direction.getLeftPerpendicular()
-    else:
-      variation = direction.getRightPerpendicular()
-
-    direction = (direction * (random() * 10) + variation * random()).getNormalized()
-
-    self.pos += direction * self.speed
-
-    self.arrivedAtTarget = (self.target - self.pos).getLengthSqr() < self.minTargetDistance
-
-  def draw(self, screen):
-    if self.type == MotiveType.Pedestrian:
-      pygame.draw.circle(screen, self.color, self.pos.toIntArr(), self.size)
-    if self.type == MotiveType.Car:
-      pygame.draw.rect(screen, self.color, self.pos.toIntArr() + self.size)
+import numpy
+from motivepool import MotiveType, MotivePool
+from motiverenderer import MotiveRenderer
+from simclock import PygameClock
+from citylog import log
 
 class Simulator:
-  def __init__(self, blobManager, roadManager):
+  def __init__(self, blobManager, roadManager, clock=None):
     self.blobManager = blobManager
     self.roadManager = roadManager
+    self.clock = clock or PygameClock()
 
-    self.motives = []
+    self.motives = MotivePool()
+    self.renderer = MotiveRenderer((255, 0, 0))
     self.targetPopulation = 1000
 
-  def fartherAway(self, start, endA, endB):
-    distA = (endA-start).getLengthSqr()
-    distB = (endB-start).getLengthSqr()
+  def update(self, dt):
+    time = self.clock.getTicks()
 
-    return endA if distA < distB else endB
+    pool = self.motives
+    slots, arrived, expired = pool.step(time, dt)
 
-  def update(self, dt):
-    time = pygame.time.get_ticks()
-
-    dead = []
-    for motive in self.motives:
-      motive.update(dt)
-
-      if (time - motive.age) > motive.ttl:
-        dead.append(motive)
-      else:
-        if motive.arrivedAtTarget:
-          motive.start = motive.target
-          if self.blobManager.blobDict.has_key(motive.targetId):
-            blob = self.blobManager.blobDict[motive.targetId]
-            if len(blob.roads) > 0:
-              road = choice(blob.roads)
-              motive.target = self.fartherAway(motive.pos, road.start, road.end)
-              motive.targetId = road.startId if motive.target == road.start else road.endId
-
-    for deadMotive in dead:
-      print "died"
-      self.motives.remove(deadMotive)
+    arrivedSlots = slots[arrived & ~expired]
+    pool.startX[arrivedSlots] = pool.targetX[arrivedSlots]
+    pool.startY[arrivedSlots] = pool.targetY[arrivedSlots]
+
+    graph = self.roadManager.graph
+    if graph is not None and len(arrivedSlots) > 0:
+      self.route(graph, arrivedSlots, graph.nodeIndex(pool.targetId[arrivedSlots]))
+
+    log.count("motives died", int(expired.sum()))
+    pool.remove(slots[expired])
 
     if len(self.roadManager.roads) > 0:
-      if len(self.motives) < self.targetPopulation:
-        if len(self.motives) == 0:
-          for i in range(100):
-            self.spawn()
+      if len(pool) < self.targetPopulation:
+        if len(pool) == 0:
+          self.spawn(100)
         else:
           self.spawn()
 
-  def spawn(self):
-    road = choice(self.roadManager.roads)
-    self.motives.append(Motive(road.start, road.end, road.endId, choice([MotiveType.Car, MotiveType.Pedestrian])))
+  def route(self, graph, slots, nodes):
+    # motives standing on a node walk on towards their destination
+    known = nodes >= 0
+    slots = slots[known]
+    nodes = nodes[known]
+    if len(slots) == 0 or len(graph.destinations) == 0:
+      return
+
+    pool = self.motives
+    rows = graph.destinationRow(pool.destinationId[slots])
+
+    # reaching the destination, or losing it with a road rebuild, starts a new trip
+    finished = rows < 0
+    finished[~finished] = graph.destinations[rows[~finished]] == nodes[~finished]
+    rows[finished] = graph.randomDestinationRow(nodes[finished])
+    pool.destinationId[slots] = numpy.where(rows >= 0, graph.destinationIds[rows], -1)
+
+    hops = graph.route(nodes, rows)
+    moving = hops >= 0
+    slots = slots[moving]
+    hops = hops[moving]
+    pool.targetX[slots] = graph.x[hops]
+    pool.targetY[slots] = graph.y[hops]
+    pool.targetId[slots] = graph.nodeIds[hops]
+
+  def spawn(self, count=1):
+    graph = self.roadManager.graph
+    if graph is None:
+      return
+
+    edges = graph.randomEdges(count)
+    if len(edges) == 0:
+      return
+
+    origins = graph.edgeA[edges]
+    rows = graph.randomDestinationRow(origins)
+    hops = graph.route(origins, rows)
+    destinationIds = numpy.where(rows >= 0, graph.destinationIds[rows], -1) if len(graph.destinationIds) > 0 else -1
+
+    self.motives.spawn(graph.x[origins], graph.y[origins], graph.x[hops], graph.y[hops], graph.nodeIds[hops],
+      numpy.where(numpy.random.random(len(edges)) > 0.5, MotiveType.Car, MotiveType.Pedestrian),
+      self.clock.getTicks(), destinationIds)
 
   def draw(self, screen):
-    for motive in self.motives:
-      motive.draw(screen)
\ No newline at end of file
+    pool = self.motives
+    slots = pool.activeSlots()
+    return self.renderer.draw(screen, pool.x[slots], pool.y[slots], pool.type[slots] == MotiveType.Car,
+      pool.width[slots], pool.height[slots])
@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+
+import math
+
+class SpatialHash:
+  def __init__(self, cellSize=32):
+    self.cellSize = float(cellSize)
+    self.cells = {}
+    self.keys = {}
+
+  def getKey(self, pos):
+    return (int(math.floor(pos[0] / self.cellSize)), int(math.floor(pos[1] / self.cellSize)))
+
+  def insert(self, id, pos, item):
+    key = self.getKey(pos)
+    self.keys[id] = key
+    if not self.cells.has_key(key):
+      self.cells[key] = {}
+    self.cells[key][id] = item
+
+  def remove(self, id):
+    key = self.keys.pop(id, None)
+    if key is None:
+      return
+
+    cell = self.cells[key]
+    cell.pop(id, None)
+    if len(cell) == 0:
+      del self.cells[key]
+
+  def update(self, id, pos, item):
+    key = self.getKey(pos)
+    if self.keys.get(id) == key:
+      self.cells[key][id] = item
+    else:
+      self.remove(id)
+      self.insert(id, pos, item)
+
+  def clear(self):
+    self.cells = {}
+    self.keys = {}
+
+  def query(self, pos, radius):
+    result = []
+
+    minX, minY = self.getKey((pos[0] - radius, pos[1] - radius))
+    maxX, maxY = self.getKey((pos[0] + radius, pos[1] + radius))
+    for x in range(minX, maxX + 1):
+      for y in range(minY, maxY + 1):
+        cell = self.cells.get((x, y))
+        if cell:
+          result.extend(cell.itervalues())
+
+    return result
+
+  def queryMany(self, xs, ys, radii):
+    # (query index, item) for every item near each of the given positions
+    first = []
+    second = []
+    for i, (x, y, radius) in enumerate(zip(xs, ys, radii)):
+      items = self.query((x, y), radius)
+      first.extend([i] * len(items))
+      second.extend(items)
+
+    return first, second
+
+  def __len__(self):
+    return len(self.keys)
@@ -2,19 +2,26 @@
 
 from random import *
 from math import *
+import numpy
 
-class Vector:
-  def __init__(self, x=0, y=0):
-    self.x = 0
-    self.y = 0
-    if isinstance(x, tuple) or isinstance(x, list):
-      y = x[1]
-      x = x[0]
-    elif isinstance(x, Vector):
-      y = x.y
-      x = x.x
+Scalar = (int, long, float)
+
+class Vector(object):
+  __slots__ = ('x', 'y')
 
-    self.set(x,y)
+  def __init__(self, x=0, y=0):
+    # plain numbers are by far the most common case
+    t = type(x)
+    if t is float or t is int:
+      self.x = x
+      self.y = y
+    elif t is Vector:
+      self.x = x.x
+      self.y = x.y
+    else:
+      self.x = 0
+      self.y = 0
+      self.set(x, y)
 
   @staticmethod
   def random(size=1):
@@ -35,11 +42,20 @@ class Vector:
 
   @staticmethod
   def distance(a, b):
-    return (a - b).getLength()
+    return sqrt(Vector.distanceSqr(a, b))
 
   @staticmethod
   def distanceSqr(a, b):
-    return (a - b).getLengthSqr()
+    # lists and tuples, like pygame event positions, work as well
+    if type(a) is Vector or isinstance(a, Vector):
+      ax, ay = a.x, a.y
+    else:
+      ax, ay = a[0], a[1]
+    if type(b) is Vector or isinstance(b, Vector):
+      bx, by = b.x, b.y
+    else:
+      bx, by = b[0], b[1]
+    return (ax - bx)**2 + (ay - by)**2
 
   @staticmethod
   def angle(v1, v2):
@@ -57,7 +73,7 @@ class Vector:
     elif isinstance(other, tuple) or isinstance(other, list):
       self.x = other[0]
       self.y = other[1]
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       self.x = x
       self.y = y
     else:
@@ -65,11 +81,15 @@ class Vector:
 
   def toArr(self): return [self.x, self.y]
   def toInt(self): return Vector(int(self.x), int(self.y))
-  def toIntArr(self): return self.toInt().toArr()
+  def toIntArr(self): return [int(self.x), int(self.y)]
+
+  def dotproduct(self, other):
+    return self.x * other.x + self.y * other.y
 
   def getNormalized(self):
-    if len(self) != 0:
-      return self / self.getLength()
+    length = sqrt(self.x * self.x + self.y * self.y)
+    if length != 0:
+      return Vector(self.x / length, self.y / length)
     else: return Vector(0,0)
 
   def getLeftPerpendicular(self):
@@ -78,21 +98,52 @@ class Vector:
   def getRightPerpendicular(self):
     return Vector(self.y, -self.x)
 
+  # in place variants, they return the vector itself for chaining
+  def normalize(self):
+    length = sqrt(self.x * self.x + self.y * self.y)
+    if length != 0:
+      self.x /= length
+      self.y /= length
+    return self
+
+  def perpendicularLeft(self):
+    self.x, self.y = -self.y, self.x
+    return self
+
+  def perpendicularRight(self):
+    self.x, self.y = self.y, -self.x
+    return self
+
+  def addScaled(self, other, factor):
+    self.x += other.x * factor
+    self.y += other.y * factor
+    return self
+
   def __add__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is Vector:
+      return Vector(self.x + other.x, self.y + other.y)
+    elif t is float or t is int:
+      return Vector(self.x + other, self.y + other)
+    elif isinstance(other, Vector):
       return Vector(self.x + other.x, self.y + other.y)
     elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(self.x + other[0], self.y + other[1])
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(self.x + other, self.y + other)
     else:
       return NotImplemented
   def __sub__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is Vector:
       return Vector(self.x - other.x, self.y - other.y)
-    if  isinstance(other, tuple) or isinstance(other, list):
+    elif t is float or t is int:
+      return Vector(self.x - other, self.y - other)
+    elif isinstance(other, Vector):
+      return Vector(self.x - other.x, self.y - other.y)
+    elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(self.x - other[0], self.y - other[1])
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(self.x - other, self.y - other)
     else:
       return NotImplemented
@@ -101,25 +152,35 @@ class Vector:
       return Vector(other.x - self.x, other.y - self.y)
     elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(other[0] - self.x, other[1] - self.y)
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(other - self.x, other - self.y)
     else:
       return NotImplemented
   def __mul__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is float or t is int:
+      return Vector(self.x * other, self.y * other)
+    elif t is Vector:
+      return Vector(self.x * other.x, self.y * other.y)
+    elif isinstance(other, Vector):
       return Vector(self.x * other.x, self.y * other.y)
     elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(self.x * other[0], self.y * other[1])
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(self.x * other, self.y * other)
     else:
       return NotImplemented
   def __div__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is float or t is int:
+      return Vector(self.x / other, self.y / other)
+    elif t is Vector:
+      return Vector(self.x / other.x, self.y / other.y)
+    elif isinstance(other, Vector):
       return Vector(self.x / other.x, self.y / other.y)
     elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(self.x / other[0], self.y / other[1])
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(self.x / other, self.y / other)
     else:
       return NotImplemented
@@ -128,18 +189,19 @@ class Vector:
       return Vector(other.x / self.x, other.y / self.y)
     elif  isinstance(other, tuple) or isinstance(other, list):
       return Vector(other[0] / self.x, other[1] / self.y)
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       return Vector(other / self.x, other / self.y)
     else:
       return NotImplemented
   def __pow__(self, other):
-    if isinstance(other, int) or isinstance(other, float):
+    if isinstance(other, Scalar):
       return Vector(self.x ** other, self.y ** other)
     else:
       return NotImplemented
 
   def __iadd__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is Vector or isinstance(other, Vector):
       self.x += other.x
       self.y += other.y
       return self
@@ -147,14 +209,15 @@ class Vector:
       self.x += other[0]
       self.y += other[1]
       return self
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       self.x += other
       self.y += other
       return self
     else:
       return NotImplemented
   def __isub__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is Vector or isinstance(other, Vector):
       self.x -= other.x
       self.y -= other.y
       return self
@@ -162,14 +225,19 @@ class Vector:
       self.x -= other[0]
       self.y -= other[1]
       return self
-    elif isinstance(other, int) or isinstance(other, float):
+    elif isinstance(other, Scalar):
       self.x -= other
       self.y -= other
       return self
     else:
       return NotImplemented
   def __imul__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is float or t is int or isinstance(other, Scalar):
+      self.x *= other
+      self.y *= other
+      return self
+    elif isinstance(other, Vector):
       self.x *= other.x
       self.y *= other.y
       return self
@@ -177,14 +245,15 @@ class Vector:
       self.x *= other[0]
       self.y *= other[1]
       return self
-    elif isinstance(other, int) or isinstance(other, float):
-      self.x *= other
-      self.y *= other
-      return self
     else:
       return NotImplemented
   def __idiv__(self, other):
-    if isinstance(other, Vector):
+    t = type(other)
+    if t is float or t is int or isinstance(other, Scalar):
+      self.x /= other
+      self.y /= other
+      return self
+    elif isinstance(other, Vector):
       self.x /= other.x
       self.y /= other.y
       return self
@@ -192,14 +261,10 @@ class Vector:
       self.x /= other[0]
       self.y /= other[1]
       return self
-    elif isinstance(other, int) or isinstance(other, float):
-      self.x /= other
-      self.y /= other
-      return self
     else:
       return NotImplemented
   def __ipow__(self, other):
-    if isinstance(other, int) or isinstance(other, float):
+    if isinstance(other, Scalar):
       self.x **= other
       self.y **= other
       return self
@@ -237,30 +302,184 @@ class Vector:
     else:
       return NotImplemented
 
-  def __eq__(self, other):
-    if isinstance(other, Vector):
-      return self.x == other.x and self.y == other.y
-    else:
-      return NotImplemented
+  __hash__ = object.__hash__
 
   def __len__(self):
-    return int(sqrt(self.x**2 + self.y**2))
+    return int(sqrt(self.x * self.x + self.y * self.y))
   def getLength(self):
-    return sqrt(self.x**2 + self.y**2)
+    return sqrt(self.x * self.x + self.y * self.y)
   def getLengthSqr(self):
-    return self.x**2 + self.y**2
+    return self.x * self.x + self.y * self.y
 
   def __getitem__(self, key):
-    if key == "x" or key == "X" or key == 0 or key == "0":
+    if key == 0 or key == "x" or key == "X" or key == "0":
       return self.x
-    elif key == "y" or key == "Y" or key == 1 or key == "1":
+    elif key == 1 or key == "y" or key == "Y" or key == "1":
       return self.y
 
-  def __str__(self): return "[x: %(x)f, y: %(y)f]" % self
-  def __repr__(self): return "{'x': %(x)f, 'y': %(y)f}" % self
+  def __str__(self): return "[x: %f, y: %f]" % (self.x, self.y)
+  def __repr__(self): return "{'x': %f, 'y': %f}" % (self.x, self.y)
 
   def __neg__(self): return Vector(-self.x, -self.y)
 
+  # slotted instances have no __dict__, pickled vectors stay plain [x, y] lists
   def __getstate__(self): return self.toArr()
-  def __setstate__(self, state): return self.set(state)
+  def __setstate__(self, state):
+    self.x = 0
+    self.y = 0
+    self.set(state)
+
+class VectorArray(object):
+  # many vectors as the rows of an (n, 2) array, with the vector api applied row wise
+  __slots__ = ('data',)
 
+  def __init__(self, data=()):
+    if isinstance(data, VectorArray):
+      data = data.data.copy()
+    elif isinstance(data, numpy.ndarray):
+      data = data.astype(numpy.float64).reshape(-1, 2)
+    else:
+      data = numpy.array([[v.x, v.y] if isinstance(v, Vector) else v for v in data], dtype=numpy.float64).reshape(-1, 2)
+    self.data = data
+
+  @staticmethod
+  def fromColumns(x, y):
+    return VectorArray(numpy.column_stack([x, y]))
+
+  @staticmethod
+  def operand(other):
+    # right hand sides broadcast against the rows: arrays, vectors, pairs or scalars
+    if isinstance(other, VectorArray):
+      return other.data
+    elif isinstance(other, Vector):
+      return numpy.array([other.x, other.y])
+    elif isinstance(other, tuple) or isinstance(other, list):
+      return numpy.asarray(other, dtype=numpy.float64)
+    elif isinstance(other, numpy.ndarray):
+      return other[:, None] if other.ndim == 1 else other
+    elif isinstance(other, Scalar) or isinstance(other, numpy.number):
+      return other
+    return None
+
+  @staticmethod
+  def distance(a, b):
+    return (a - b).getLength()
+
+  @staticmethod
+  def distanceSqr(a, b):
+    return (a - b).getLengthSqr()
+
+  @property
+  def x(self): return self.data[:, 0]
+  @property
+  def y(self): return self.data[:, 1]
+
+  def toArr(self): return self.data.tolist()
+  def toInt(self): return VectorArray(self.data.astype(numpy.int64))
+  def toIntArr(self): return self.data.astype(numpy.int64).tolist()
+
+  def dotproduct(self, other):
+    return (self.data * VectorArray.operand(other)).sum(axis=1)
+
+  def getLengthSqr(self):
+    return (self.data * self.data).sum(axis=1)
+  def getLength(self):
+    return numpy.sqrt(self.getLengthSqr())
+
+  def getNormalized(self):
+    length = self.getLength()
+    length[length == 0] = 1 # zero vectors stay zero
+    return VectorArray(self.data / length[:, None])
+
+  def getLeftPerpendicular(self):
+    return VectorArray.fromColumns(-self.data[:, 1], self.data[:, 0])
+
+  def getRightPerpendicular(self):
+    return VectorArray.fromColumns(self.data[:, 1], -self.data[:, 0])
+
+  def normalize(self):
+    length = self.getLength()
+    length[length == 0] = 1
+    self.data /= length[:, None]
+    return self
+
+  def perpendicularLeft(self):
+    self.data[:] = numpy.column_stack([-self.data[:, 1], self.data[:, 0]])
+    return self
+
+  def perpendicularRight(self):
+    self.data[:] = numpy.column_stack([self.data[:, 1], -self.data[:, 0]])
+    return self
+
+  def addScaled(self, other, factor):
+    if isinstance(factor, numpy.ndarray) and factor.ndim == 1:
+      factor = factor[:, None]
+    self.data += VectorArray.operand(other) * factor
+    return self
+
+  def __add__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(self.data + other)
+  __radd__ = __add__
+  def __sub__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(self.data - other)
+  def __rsub__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(other - self.data)
+  def __mul__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(self.data * other)
+  __rmul__ = __mul__
+  def __div__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(self.data / other)
+  __truediv__ = __div__
+  def __rdiv__(self, other):
+    other = VectorArray.operand(other)
+    return NotImplemented if other is None else VectorArray(other / self.data)
+  def __neg__(self): return VectorArray(-self.data)
+
+  def __iadd__(self, other):
+    other = VectorArray.operand(other)
+    if other is None:
+      return NotImplemented
+    self.data += other
+    return self
+  def __isub__(self, other):
+    other = VectorArray.operand(other)
+    if other is None:
+      return NotImplemented
+    self.data -= other
+    return self
+  def __imul__(self, other):
+    other = VectorArray.operand(other)
+    if other is None:
+      return NotImplemented
+    self.data *= other
+    return self
+  def __idiv__(self, other):
+    other = VectorArray.operand(other)
+    if other is None:
+      return NotImplemented
+    self.data /= other
+    return self
+
+  # unlike a single vector, the length of an array is the number of vectors in it
+  def __len__(self): return len(self.data)
+
+  def __getitem__(self, key):
+    if isinstance(key, Scalar) or isinstance(key, numpy.integer):
+      return Vector(float(self.data[key, 0]), float(self.data[key, 1]))
+    return VectorArray(self.data[key])
+
+  def __iter__(self):
+    for x, y in self.data.tolist():
+      yield Vector(x, y)
+
+  def __str__(self): return "\n".join(str(v) for v in self)
+  def __repr__(self): return "VectorArray(%r)" % self.toArr()
+
+  def __getstate__(self): return self.toArr()
+  def __setstate__(self, state):
+    self.data = numpy.array(state, dtype=numpy.float64).reshape(-1, 2)